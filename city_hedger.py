@@ -1,7 +1,8 @@
 from typing import Dict
 from hedge_game_instance import HedgeGameInstance
 from redis_client import RedisClient
-from pymongo import MongoClient
+from country_bounds import CountryBounds
+from gazetteer import Gazetteer
 import numpy as np
 
 ROUNDS = 10
@@ -14,15 +15,21 @@ class CityHedgerGameInstance(HedgeGameInstance):
 	def __init__(self,
 		instance_id: str,
 		redis_client: RedisClient,
-		mongo_client: MongoClient=None,
+		gazetteer: Gazetteer=None,
 		country: str="US",
 		min_lat: float=0,
 		max_lat: float=0,
 		min_lng: float=0,
-		max_lng: float=0):
+		max_lng: float=0,
+		country_bounds: CountryBounds=None):
 
 		super().__init__(instance_id, redis_client)
-		self.mongo_client = mongo_client
+		# without bounds from the client, use the precomputed ones for the country
+		bounds = country_bounds.get(country) if country_bounds is not None else None
+		if bounds is not None and not any([min_lat, max_lat, min_lng, max_lng]):
+			min_lat, max_lat = bounds["minLat"], bounds["maxLat"]
+			min_lng, max_lng = bounds["minLng"], bounds["maxLng"]
+		self.gazetteer = gazetteer
 		self.country = country
 		self.min_lat = min_lat
 		self.max_lat = max_lat
@@ -97,29 +104,12 @@ class CityHedgerGameInstance(HedgeGameInstance):
 	async def handle_play(self, name: str, played: str): 
 		print(f"{name} played {played}")
 
-		city_name = f'^{played}$' or ''
-		code = f'^{self.country}$' or ''
-		print('city_name, code', city_name, code)
-		city_results = []
-		for city in self.mongo_client.place_names.cities.find({'name': {'$regex': city_name, '$options': 'i'}, 'code': {'$regex': code, '$options': 'i'}}):
-			city_results.append({
-				'name': city['name'],
-				'lat': city['lat'],
-				'lng': city['lng']
-			})
-		print('city_results', city_results)
-		if len(city_results) == 0:
+		# same name cities are resolved to the one closest to the target
+		best_city, best_distance = await self.gazetteer.nearest(self.country, played, self.lat, self.lng)
+		print('best_city', best_city)
+		if best_city is None:
 			await self.notify_player(name, "play_error", {})
 			return
-		
-		# find the closest city
-		best_distance = float('inf')
-		best_city = None
-		for city in city_results:
-			distance = CityHedgerGameInstance.calculate_distance_in_km(self.lat, self.lng, city['lat'], city['lng'])
-			if distance < best_distance:
-				best_distance = distance
-				best_city = city
 
 		self.player_distances[name] = best_distance
 		self.players[name].played = best_city
@@ -172,11 +162,15 @@ class CityHedgerGameInstance(HedgeGameInstance):
 			self.players[player_name].points -= 50
 			gained[player_name]["points"] -= 50
 
+		# the real city closest to the target, what a perfect play would have been
+		optimal_cities = await self.gazetteer.nearest_cities(self.country, self.lat, self.lng, 1)
+
 		await self.notify_all_players("evaluate", {
 			"players": self.get_player_data(),
 			"gained": gained,
 			"most_popular_city": most_popular_cities[0] if len(most_popular_cities) == 1 and len(self.get_live_players()) > 1 else -1,
-			"failed": list(failed_players)
+			"failed": list(failed_players),
+			"optimal_city": optimal_cities[0] if optimal_cities else None
 		})
 
 		self.round_id += 1
@@ -0,0 +1,101 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from repositories import Repository
+
+class PendingCounter():
+    query: Dict[str, Any]
+    deltas: Dict[str, int]
+    upsert: bool
+    on_insert: Dict[str, Any]
+
+    def __init__(self, query: Dict[str, Any], upsert: bool, on_insert: Dict[str, Any]):
+        self.query = query
+        self.deltas = {}
+        self.upsert = upsert
+        self.on_insert = on_insert
+
+    def get_update(self):
+        update = { "$inc": self.deltas }
+        if self.on_insert:
+            update["$setOnInsert"] = self.on_insert
+        return UpdateOne(self.query, update, upsert=self.upsert)
+
+class CounterBuffer():
+    pending: Dict[Repository, Dict[Tuple, PendingCounter]]
+    flushing: Dict[Repository, Dict[Tuple, PendingCounter]]
+
+    # adds up small $inc writes in memory and writes them out together every flush_interval seconds
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.pending = {}
+        self.flushing = {}
+        self.task = None
+        self.lock = asyncio.Lock()
+        self.stopping = asyncio.Event()
+
+    def get_key(self, query: Dict[str, Any]):
+        return tuple(sorted(query.items()))
+
+    def increment(self, repository: Repository, query: Dict[str, Any], field: str, delta: int = 1, upsert: bool = False, on_insert: Dict[str, Any] = None):
+        counters = self.pending.setdefault(repository, {})
+        key = self.get_key(query)
+        if key not in counters:
+            counters[key] = PendingCounter(query, upsert, on_insert)
+        counters[key].deltas[field] = counters[key].deltas.get(field, 0) + delta
+
+    # what still has to reach the database, so reads can include it
+    def get_pending(self, repository: Repository, query: Dict[str, Any], field: str):
+        key = self.get_key(query)
+        total = 0
+        for counters in (self.pending, self.flushing):
+            counter = counters.get(repository, {}).get(key)
+            if counter is not None:
+                total += counter.deltas.get(field, 0)
+        return total
+
+    def requeue(self, repository: Repository, counters: List[PendingCounter]):
+        for counter in counters:
+            for field, delta in counter.deltas.items():
+                self.increment(repository, counter.query, field, delta, counter.upsert, counter.on_insert)
+
+    async def flush(self):
+        async with self.lock:
+            self.flushing, self.pending = self.pending, {}
+            for repository, counters in self.flushing.items():
+                counters = [counter for counter in counters.values() if any(counter.deltas.values())]
+                if not counters:
+                    continue
+                try:
+                    await repository.bulk_write([counter.get_update() for counter in counters], ordered=False)
+                except BulkWriteError as e:
+                    # the rest of an unordered bulk write went through, only the failed updates are kept
+                    print(f"failed to flush {len(e.details['writeErrors'])} counters: {e}")
+                    self.requeue(repository, [counters[error["index"]] for error in e.details["writeErrors"]])
+                except Exception as e:
+                    print(f"failed to flush counters: {e}")
+                    # keep the deltas for the next flush
+                    self.requeue(repository, counters)
+                self.flushing[repository] = {}
+            self.flushing = {}
+
+    async def run(self):
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    # lets the flush loop finish its last flush instead of cancelling it halfway through a write,
+    # then flushes whatever came in or was requeued during it
+    async def stop(self):
+        self.stopping.set()
+        if self.task is not None:
+            await self.task
+            self.task = None
+        await self.flush()
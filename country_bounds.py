@@ -0,0 +1,63 @@
+from typing import Any, Dict
+from pymongo.collection import Collection
+from db import normalize_key
+from repositories import Repository
+
+COUNTRY_BOUNDS_COLLECTION = "country_bounds"
+
+# min and max lat and lng of all cities, one document per country code
+COUNTRY_BOUNDS_PIPELINE = [
+    {
+        "$group": {
+            "_id": "$code",
+            "minLat": {"$min": "$lat"},
+            "maxLat": {"$max": "$lat"},
+            "minLng": {"$min": "$lng"},
+            "maxLng": {"$max": "$lng"}
+        }
+    }
+]
+
+# rebuilds the whole bounds collection, run it after cities are imported
+def refresh_country_bounds(cities: Collection):
+    cities.aggregate(COUNTRY_BOUNDS_PIPELINE + [{"$out": COUNTRY_BOUNDS_COLLECTION}])
+    return cities.database[COUNTRY_BOUNDS_COLLECTION].count_documents({})
+
+def get_bounds(document: Dict[str, Any]):
+    return {
+        "minLat": document["minLat"],
+        "maxLat": document["maxLat"],
+        "minLng": document["minLng"],
+        "maxLng": document["maxLng"]
+    }
+
+class CountryBounds():
+    bounds: Dict[str, Dict[str, float]]
+
+    # the precomputed bounds are small enough to keep every country in memory.
+    # countries missing from them, e.g. before the first refresh, are aggregated from the cities once
+    def __init__(self, cities: Repository):
+        self.cities = cities
+        self.bounds = {}
+
+    async def load(self, repository: Repository):
+        self.bounds = {
+            normalize_key(document["_id"]): get_bounds(document)
+            for document in await repository.find({}) if document["_id"]
+        }
+        if not self.bounds:
+            print("no country bounds found, falling back to the cities until python maintenance.py refresh-country-bounds is run")
+
+    def get(self, code: str):
+        return self.bounds.get(normalize_key(code))
+
+    async def fetch(self, code: str):
+        bounds = self.get(code)
+        if bounds is not None or not code:
+            return bounds
+        result = await self.cities.aggregate([{ "$match": { "code": code } }] + COUNTRY_BOUNDS_PIPELINE)
+        if not result:
+            return None
+        bounds = get_bounds(result[0])
+        self.bounds[normalize_key(code)] = bounds
+        return bounds
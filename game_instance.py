@@ -1,10 +1,12 @@
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Tuple
 from abc import ABC, abstractmethod
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketDisconnect
 import numpy as np
 from redis_client import RedisClient
+from message_codec import WebSocketCodecs
+from room_mailbox import Mailbox
 
 class GamePlayer():
     is_alive: bool
@@ -14,6 +16,17 @@ class GamePlayer():
         self.is_alive = False
 
 ROUNDS = 10
+MAILBOX_SIZE = 256
+MAILBOX_BATCH_SIZE = 64
+# put in the mailbox by the server itself, a client cannot send it
+RESET = object()
+
+# two broadcasts are the same if only the game state they carry differs
+def is_same_broadcast(first: Tuple[str, Dict[str, Any]], second: Tuple[str, Dict[str, Any]]):
+    try:
+        return first[0] == second[0] and bool(first[1] == second[1])
+    except ValueError:
+        return False
 
 class GameInstance(ABC):
     instance_id: str
@@ -24,6 +37,10 @@ class GameInstance(ABC):
     game_state: str
     redis_client: RedisClient
     seed: float
+    # shared by every game, main replaces it with the deployment's codecs
+    websocket_codecs: WebSocketCodecs = WebSocketCodecs("json")
+    # created once, resetting the game keeps it
+    mailbox: Mailbox = None
 
     # init
     def __init__(self, instance_id: str, redis_client: RedisClient):
@@ -35,11 +52,63 @@ class GameInstance(ABC):
         self.game_state = "lobby"
         self.redis_client = redis_client
         self.seed = None
+        self.batching = False
+        self.outbox = []
+        # messages for the room go through its mailbox, so only one batch changes the game at a time
+        if self.mailbox is None:
+            self.mailbox = Mailbox(self.instance_id, MAILBOX_SIZE, MAILBOX_BATCH_SIZE, self.handle_batch)
 
     async def start_redis(self):
-        await self.redis_client.subscribe(self.instance_id, self.handle_redis_message)
+        await self.redis_client.attach(self.instance_id, self.mailbox)
         print(f"subscribed to {self.instance_id}")
 
+    async def stop_redis(self):
+        await self.redis_client.unsubscribe(self.instance_id)
+        if self.mailbox is not None:
+            self.mailbox.stop()
+
+    # broadcasts made while handling the batch are held back and sent once it is done
+    async def handle_batch(self, batch: List[Dict[str, Any]]):
+        self.batching = True
+        try:
+            for data in batch:
+                try:
+                    if data.get("method") is RESET:
+                        self.reset_if_abandoned()
+                    else:
+                        await self.handle_redis_message(data)
+                except Exception as e:
+                    print(f"error handling {data} for {self.instance_id}: {e}")
+        finally:
+            self.batching = False
+            await self.flush_outbox()
+
+    # when a player has a run of the same broadcast, e.g. one "play" per player who played,
+    # only the last of the run is sent, since it carries the latest state
+    async def flush_outbox(self):
+        outbox, self.outbox = self.outbox, []
+        by_player = {}
+        for player_name, broadcast, payload in outbox:
+            by_player.setdefault(player_name, []).append((broadcast, payload))
+
+        for player_name, messages in by_player.items():
+            for index, (broadcast, payload) in enumerate(messages):
+                if index + 1 < len(messages) and is_same_broadcast(broadcast, messages[index + 1][0]):
+                    continue
+                websocket = self.websocket_connections.get(player_name)
+                if websocket is None:
+                    break
+                try:
+                    await self.websocket_codecs.send(websocket, payload)
+                except Exception as e:
+                    print(f"Error sending to {player_name}: {e}. Disconnecting...")
+                    # handle_disconnect waits a minute, which must not hold up the mailbox
+                    asyncio.create_task(self.handle_disconnect(player_name))
+                    break
+
+    def has_connections(self):
+        return len(self.websocket_connections) > 0
+
     @abstractmethod
     def get_player_data(self):
         pass
@@ -52,7 +121,7 @@ class GameInstance(ABC):
         print("handling client")
         try:
             while True:
-                data = await websocket.receive_json()
+                data = await self.websocket_codecs.receive(websocket)
                 if data["method"] == "join":
                     name = data.get('name', '')
                     if name in self.websocket_connections:
@@ -72,7 +141,7 @@ class GameInstance(ABC):
         pass
 
     async def handle_connect(self, websocket: WebSocket):
-        await websocket.send_json({
+        await self.websocket_codecs.send(websocket, {
             "method": "connect",
             "players": self.get_player_data()
         })
@@ -85,7 +154,7 @@ class GameInstance(ABC):
 
     async def handle_join_player_exists(self, player_name: str, websocket: WebSocket):
         print(f"player {player_name} already exists")
-        await websocket.send_json({
+        await self.websocket_codecs.send(websocket, {
             "method": "join_error",
             "message": "Player already exists",
             "players": self.get_player_data()
@@ -93,7 +162,7 @@ class GameInstance(ABC):
 
     async def notify_all_players(self, method: str, data: Dict[str, Any]):
         print(f"notifying all players with {method}")
-        for player_name in self.websocket_connections:
+        for player_name in list(self.websocket_connections):
             await self.notify_player(player_name, method, data)
 
     async def notify_player(self, player_name: str, method: str, data: Dict[str, Any]):
@@ -109,22 +178,30 @@ class GameInstance(ABC):
                 "players": self.get_player_data(),
                 **data
             }
-            await websocket.send_json(payload)
+            if self.batching:
+                self.outbox.append((player_name, (method, data), payload))
+                return
+            await self.websocket_codecs.send(websocket, payload)
         except Exception as e:
             print(f"Error sending to {player_name}: {e}. Disconnecting...")
             await self.handle_disconnect(player_name)
 
+    # the leave and the reset go through the mailbox, so they never change the game in the middle of a batch
     async def handle_disconnect(self, player_name: str):
         print(f"handling disconnect for {player_name}")
         if player_name in self.players:
             del self.websocket_connections[player_name]
-            await self.handle_leave(player_name)
-            
+            await self.mailbox.put({ "method": "leave", "name": player_name })
+
         # if all players disconnected, reset game after a while
         await asyncio.sleep(60)
+        await self.mailbox.put({ "method": RESET })
+
+    def reset_if_abandoned(self):
         if len(self.websocket_connections) == 0:
             self.__init__(self.instance_id, self.redis_client)
-            return
+            # the rest of the batch is still held back until it is done
+            self.batching = True
 
     @abstractmethod
     async def handle_leave(self, player_name: str):
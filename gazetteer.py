@@ -0,0 +1,230 @@
+import asyncio
+import bisect
+import re
+import sys
+from collections import OrderedDict
+from typing import Any, Dict, List
+import numpy as np
+from db import normalize_key
+from repositories import Repository
+from spatial_index import SphereIndex
+
+EARTH_RADIUS_KM = 6371
+# rough per-entry cost of the python objects around the arrays (dict slots, small arrays, list pointers)
+ENTRY_OVERHEAD_BYTES = 200
+# results for one and two letter prefixes cover most of a country, so they are kept once computed
+CACHED_PREFIX_LENGTH = 2
+# sphere index cells are about this wide, as a fraction of the earth's radius
+SPHERE_CELL_SIZE = 25 / EARTH_RADIUS_KM
+
+# name_lower and code_lower are filled in by python maintenance.py backfill-city-keys. cities imported before
+# they existed are matched on name and code ignoring case instead, which the index only narrows down to them
+def city_query(code: str, name: str = None):
+    keyed = { "code_lower": normalize_key(code) }
+    unkeyed = { "code_lower": { "$exists": False }, "code": exact_match(code) }
+    if name is not None:
+        keyed["name_lower"] = normalize_key(name)
+        unkeyed["name"] = exact_match(name)
+    return { "$or": [keyed, unkeyed] }
+
+def exact_match(value: str):
+    return { "$regex": f"^{re.escape(normalize_key(value))}$", "$options": "i" }
+
+async def warn_missing_city_keys(cities: Repository):
+    if await cities.find_one({ "code_lower": { "$exists": False } }, { "_id": True }) is not None:
+        print("WARNING: some cities have no name_lower/code_lower, city lookups scan them until python maintenance.py backfill-city-keys is run")
+
+# padded like pg_trgm, so the start and end of a name count for more
+def trigrams(key: str):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray):
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats, lngs = np.radians(lats.astype(np.float64)), np.radians(lngs.astype(np.float64))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+class CountryGazetteer():
+    names: List[str]
+    lat: np.ndarray
+    lng: np.ndarray
+    indices: Dict[str, np.ndarray]
+    keys: List[str]
+    trigram_counts: np.ndarray
+    postings: Dict[str, np.ndarray]
+    sorted_keys: List[str]
+    key_population: np.ndarray
+    key_city: np.ndarray
+    sphere_index: SphereIndex
+    nbytes: int
+
+    # every city of one country, as arrays instead of one dict per city
+    def __init__(self, cities: List[Dict[str, Any]]):
+        self.names = [sys.intern(city["name"]) for city in cities]
+        self.lat = np.array([city["lat"] for city in cities], dtype=np.float32)
+        self.lng = np.array([city["lng"] for city in cities], dtype=np.float32)
+        self.population = np.array([city.get("population") or 0 for city in cities], dtype=np.float32)
+        indices = {}
+        for index, name in enumerate(self.names):
+            indices.setdefault(normalize_key(name), []).append(index)
+        self.indices = {key: np.array(value, dtype=np.int32) for key, value in indices.items()}
+        self.keys = list(self.indices)
+        self.postings = None
+        self.sorted_keys = None
+        self.prefix_cache = {}
+        self.sphere_index = None
+        self.nbytes = (sum(sys.getsizeof(name) for name in set(self.names)) + 3 * self.lat.nbytes
+                       + sum(sys.getsizeof(key) + ENTRY_OVERHEAD_BYTES for key in self.keys))
+
+    # trigram -> the keys that contain it, only built once a misspelled name is played
+    def build_trigram_index(self):
+        postings = {}
+        counts = np.zeros(len(self.keys), dtype=np.int32)
+        for key_index, key in enumerate(self.keys):
+            key_trigrams = trigrams(key)
+            counts[key_index] = len(key_trigrams)
+            for trigram in key_trigrams:
+                postings.setdefault(trigram, []).append(key_index)
+        self.trigram_counts = counts
+        self.postings = {trigram: np.array(value, dtype=np.int32) for trigram, value in postings.items()}
+        self.nbytes += counts.nbytes + sum(value.nbytes + ENTRY_OVERHEAD_BYTES for value in self.postings.values())
+
+    # the known name with the highest trigram similarity (shared / union), if it reaches the threshold
+    def closest_key(self, name: str, threshold: float):
+        if self.postings is None:
+            self.build_trigram_index()
+        name_trigrams = trigrams(normalize_key(name))
+        query = [self.postings[trigram] for trigram in name_trigrams if trigram in self.postings]
+        if not query:
+            return None
+
+        shared = np.bincount(np.concatenate(query), minlength=len(self.keys))
+        candidates = np.flatnonzero(shared)
+        similarity = shared[candidates] / (len(name_trigrams) + self.trigram_counts[candidates] - shared[candidates])
+        best = int(np.argmax(similarity))
+        if similarity[best] < threshold:
+            return None
+        return self.keys[candidates[best]]
+
+    # keys in sorted order, so every key with a prefix is one contiguous range, along with
+    # the most populous city of each key
+    def build_prefix_index(self):
+        sorted_keys = sorted(self.keys)
+        key_city = np.array([self.indices[key][np.argmax(self.population[self.indices[key]])] for key in sorted_keys], dtype=np.int32)
+        self.key_population = self.population[key_city]
+        self.key_city = key_city
+        self.sorted_keys = sorted_keys
+        self.nbytes += key_city.nbytes + self.key_population.nbytes + 8 * len(sorted_keys)
+
+    # the k most populous cities whose name starts with the prefix
+    def suggest(self, prefix: str, k: int):
+        if self.sorted_keys is None:
+            self.build_prefix_index()
+        prefix = normalize_key(prefix)
+        if (prefix, k) in self.prefix_cache:
+            return self.prefix_cache[(prefix, k)]
+
+        start = bisect.bisect_left(self.sorted_keys, prefix)
+        end = bisect.bisect_left(self.sorted_keys, prefix + "\U0010ffff", start)
+        population = self.key_population[start:end]
+        if len(population) > k:
+            top = np.argpartition(-population, k)[:k]
+        else:
+            top = np.arange(len(population))
+        top = top[np.argsort(-population[top], kind="stable")]
+        suggestions = [{
+            "name": self.names[index],
+            "lat": round(float(self.lat[index]), 5),
+            "lng": round(float(self.lng[index]), 5),
+            "population": int(self.population[index])
+        } for index in self.key_city[start + top].tolist()]
+
+        if len(prefix) <= CACHED_PREFIX_LENGTH:
+            self.prefix_cache[(prefix, k)] = suggestions
+        return suggestions
+
+    # the k cities closest to a position, whatever their names, closest first
+    def nearest_cities(self, lat: float, lng: float, k: int):
+        if self.sphere_index is None:
+            self.sphere_index = SphereIndex(self.lat, self.lng, SPHERE_CELL_SIZE)
+            self.nbytes += self.sphere_index.xyz.nbytes + len(self.sphere_index.cells) * ENTRY_OVERHEAD_BYTES
+        indices, chords = self.sphere_index.nearest(lat, lng, k)
+        return [{
+            "name": self.names[index],
+            "lat": round(float(self.lat[index]), 5),
+            "lng": round(float(self.lng[index]), 5),
+            "distance": float(2 * EARTH_RADIUS_KM * np.arcsin(min(chord / 2, 1)))
+        } for index, chord in zip(indices.tolist(), chords.tolist())]
+
+    # the city with this name that is closest to the given position, with its distance in km.
+    # names without an exact match fall back to the most similar known name
+    def nearest(self, name: str, lat: float, lng: float, threshold: float = 1):
+        candidates = self.indices.get(normalize_key(name))
+        if candidates is None and threshold < 1:
+            key = self.closest_key(name, threshold)
+            candidates = self.indices.get(key) if key is not None else None
+        if candidates is None:
+            return None, None
+        distances = haversine_km(lat, lng, self.lat[candidates], self.lng[candidates])
+        best = int(np.argmin(distances))
+        index = candidates[best]
+        return {
+            "name": self.names[index],
+            "lat": round(float(self.lat[index]), 5),
+            "lng": round(float(self.lng[index]), 5)
+        }, float(distances[best])
+
+class Gazetteer():
+    countries: "OrderedDict[str, CountryGazetteer]"
+    locks: Dict[str, asyncio.Lock]
+
+    # countries are loaded the first time they are used and the least recently used are dropped
+    # once there are more than max_countries or they take up more than max_bytes
+    def __init__(self, repository: Repository, max_countries: int, match_threshold: float = 1, max_bytes: int = None):
+        self.repository = repository
+        self.max_countries = max_countries
+        self.max_bytes = max_bytes
+        self.match_threshold = match_threshold
+        self.countries = OrderedDict()
+        self.locks = {}
+
+    def is_over_budget(self):
+        if len(self.countries) > self.max_countries:
+            return True
+        return self.max_bytes is not None and sum(country.nbytes for country in self.countries.values()) > self.max_bytes
+
+    # the most recently used country is always kept, even if it alone is over the budget
+    def evict(self):
+        while len(self.countries) > 1 and self.is_over_budget():
+            self.countries.popitem(last=False)
+
+    async def get_country(self, code: str):
+        code = normalize_key(code)
+        if code in self.countries:
+            self.countries.move_to_end(code)
+            self.evict()
+            return self.countries[code]
+
+        # only one play loads a country, the rest wait for it
+        lock = self.locks.setdefault(code, asyncio.Lock())
+        async with lock:
+            country = self.countries.get(code)
+            if country is None:
+                cities = await self.repository.find(city_query(code), { "_id": False, "name": True, "lat": True, "lng": True, "population": True })
+                country = CountryGazetteer(cities)
+                # codes come from the clients, so an unknown one is not kept where it could push out real countries
+                if cities:
+                    self.countries[code] = country
+                    self.evict()
+            self.locks.pop(code, None)
+        return country
+
+    async def nearest(self, code: str, name: str, lat: float, lng: float):
+        return (await self.get_country(code)).nearest(name, lat, lng, self.match_threshold)
+
+    async def nearest_cities(self, code: str, lat: float, lng: float, k: int):
+        return (await self.get_country(code)).nearest_cities(lat, lng, k)
+
+    async def suggest(self, code: str, prefix: str, k: int):
+        return (await self.get_country(code)).suggest(prefix, k)
@@ -8,14 +8,16 @@ from blurry_battle import BlurryBattleGameInstance
 from stat_guessr import StatGuessrGameInstance
 from location_guessr import LocationGuessrGameInstance
 from redis_client import RedisClient
+from room_registry import RoomRegistry
 
 class GuessGameMaker():
     game_data: Dict[str, GuessGameInstance]
 
     # init
-    def __init__(self, redis_client: RedisClient):
+    def __init__(self, redis_client: RedisClient, room_registry: RoomRegistry):
         self.game_data = {}
         self.redis_client = redis_client
+        self.room_registry = room_registry
 
     async def get_game_data(self, game_type: str, game_id: str, redis_client: RedisClient, deck_size: int = None, field_size: int = None, max_distance: float = None):
         instance_id = f'{game_type}-{game_id}'
@@ -30,5 +32,15 @@ class GuessGameMaker():
                 self.game_data[instance_id] = StatGuessrGameInstance(instance_id, redis_client, deck_size=deck_size, field_size=field_size)
             elif game_type == "location-guessr":
                 self.game_data[instance_id] = LocationGuessrGameInstance(instance_id, redis_client, deck_size=deck_size, max_distance=max_distance)
-            asyncio.create_task(self.game_data[instance_id].start_redis())
-        return self.game_data[instance_id]
\ No newline at end of file
+            redis_task = asyncio.create_task(self.game_data[instance_id].start_redis())
+            self.room_registry.register("guess", instance_id, self.game_data[instance_id],
+                                        lambda: self.remove_game_data(instance_id, redis_task))
+        self.room_registry.touch("guess", instance_id)
+        return self.game_data[instance_id]
+
+    # drops an idle game and its channel, called by the room registry
+    async def remove_game_data(self, instance_id: str, redis_task: asyncio.Task):
+        game_data = self.game_data.pop(instance_id, None)
+        redis_task.cancel()
+        if game_data is not None:
+            await game_data.stop_redis()
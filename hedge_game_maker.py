@@ -7,16 +7,18 @@ from midpoint_master import MidpointMasterGameInstance
 from city_hedger import CityHedgerGameInstance
 from number_nightmare import NumberNightmareGameInstance
 from redis_client import RedisClient
+from room_registry import RoomRegistry
 
 class HedgeGameMaker():
     game_data: Dict[str, HedgeGameInstance]
 
     # init
-    def __init__(self, redis_client: RedisClient):
+    def __init__(self, redis_client: RedisClient, room_registry: RoomRegistry):
         self.game_data = {}
         self.redis_client = redis_client
+        self.room_registry = room_registry
 
-    async def get_game_data(self, game_type: str, game_id: str, redis_client: RedisClient, deck_size: int = None, mongo_client=None, country: str='', min_lat: float=0, max_lat: float=0, min_lng: float=0, max_lng: float=0):
+    async def get_game_data(self, game_type: str, game_id: str, redis_client: RedisClient, deck_size: int = None, gazetteer=None, country: str='', min_lat: float=0, max_lat: float=0, min_lng: float=0, max_lng: float=0, country_bounds=None):
         instance_id = f'{game_type}-{game_id}'
         if instance_id not in self.game_data:
             if game_type == "data-hedger":
@@ -24,8 +26,18 @@ class HedgeGameMaker():
             elif game_type == "midpoint-master":
                 self.game_data[instance_id] = MidpointMasterGameInstance(instance_id, redis_client)
             elif game_type == "city-hedger":
-                self.game_data[instance_id] = CityHedgerGameInstance(instance_id, redis_client, mongo_client=mongo_client, country=country, min_lat=min_lat, max_lat=max_lat, min_lng=min_lng, max_lng=max_lng)
+                self.game_data[instance_id] = CityHedgerGameInstance(instance_id, redis_client, gazetteer=gazetteer, country=country, min_lat=min_lat, max_lat=max_lat, min_lng=min_lng, max_lng=max_lng, country_bounds=country_bounds)
             elif game_type == "number-nightmare":
                 self.game_data[instance_id] = NumberNightmareGameInstance(instance_id, redis_client, deck_size=deck_size)
-            asyncio.create_task(self.game_data[instance_id].start_redis())
-        return self.game_data[instance_id]
\ No newline at end of file
+            redis_task = asyncio.create_task(self.game_data[instance_id].start_redis())
+            self.room_registry.register("hedge", instance_id, self.game_data[instance_id],
+                                        lambda: self.remove_game_data(instance_id, redis_task))
+        self.room_registry.touch("hedge", instance_id)
+        return self.game_data[instance_id]
+
+    # drops an idle game and its channel, called by the room registry
+    async def remove_game_data(self, instance_id: str, redis_task: asyncio.Task):
+        game_data = self.game_data.pop(instance_id, None)
+        redis_task.cancel()
+        if game_data is not None:
+            await game_data.stop_redis()
@@ -0,0 +1,65 @@
+import pymongo
+from typing import Any, Dict, List, Tuple
+from pymongo.errors import OperationFailure
+from db import MongoClients
+from repositories import Repository
+
+# (keys, options) of every index
+CITY_INDEXES = [
+    ([("code_lower", pymongo.ASCENDING), ("name_lower", pymongo.ASCENDING)], {}),
+]
+
+MEETUPMAKER_INDEXES = {
+    "comments": [
+        ([("key", pymongo.ASCENDING), ("poster", pymongo.ASCENDING)], {}),
+    ],
+    # rating upserts rely on (category, item) being unique, otherwise two first ratings can create two items
+    "ratings": [
+        ([("category", pymongo.ASCENDING), ("item", pymongo.ASCENDING)], { "unique": True }),
+        ([("category", pymongo.ASCENDING), ("item_lower", pymongo.ASCENDING)], {}),
+    ],
+}
+
+# upserts on quiz_name rely on it being unique, otherwise two first submissions can create two quizzes
+QUIZ_INDEXES = [
+    ([("quiz_name", pymongo.ASCENDING)], { "unique": True }),
+]
+
+# create_index is a no-op when the index already exists, so this is safe to run on every startup.
+# a unique index cannot be built over existing duplicates or replace the old non-unique index in place,
+# the maintenance command merges the duplicates and swaps the index
+async def create_indexes(collection: Any, indexes: List[Tuple[List[Tuple[str, int]], Dict[str, Any]]], dedupe_command: str = None):
+    for keys, options in indexes:
+        try:
+            await collection.create_index(keys, **options)
+        except OperationFailure as e:
+            if not options.get("unique"):
+                raise
+            print(f"could not create unique index {keys}, run python maintenance.py {dedupe_command}: {e}")
+
+async def bootstrap_indexes(clients: MongoClients):
+    await create_indexes(clients.async_cities.place_names.cities, CITY_INDEXES)
+
+    meetupmaker = clients.async_meetup.meetupmaker
+    for collection, indexes in MEETUPMAKER_INDEXES.items():
+        await create_indexes(meetupmaker[collection], indexes, f"dedupe-{collection}")
+
+    # every quiz type is its own collection
+    quiz = clients.async_meetup.quiz
+    for collection in await quiz.list_collection_names():
+        await create_indexes(quiz[collection], QUIZ_INDEXES, "dedupe-quizzes")
+        indexed_quiz_types.add(collection)
+
+# quiz types are chosen by the clients, so a new type gets its indexes the first time it is used
+indexed_quiz_types = set()
+
+async def ensure_quiz_indexes(quizzes: Repository):
+    quiz_type = quizzes.collection.name
+    if quiz_type in indexed_quiz_types:
+        return
+    await create_indexes(quizzes.collection, QUIZ_INDEXES, "dedupe-quizzes")
+    indexed_quiz_types.add(quiz_type)
+
+# the rating lists sort by any rated field, the maintenance command creates these for every field in use
+def rating_sort_index(field: str):
+    return [("category", pymongo.ASCENDING), (field, pymongo.ASCENDING), ("_id", pymongo.ASCENDING)]
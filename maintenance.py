@@ -0,0 +1,156 @@
+import sys
+from typing import Any, Dict, List
+from pymongo import DeleteMany, UpdateOne
+from pymongo.collection import Collection
+from db import MongoClients, normalize_key
+from country_bounds import refresh_country_bounds
+from indexes import MEETUPMAKER_INDEXES, QUIZ_INDEXES, rating_sort_index
+from quiz_repository import QUIZ_LEADERBOARD_SIZE
+
+BATCH_SIZE = 1000
+
+# sets each target field to the normalized value of its source field, on documents that are missing any target
+def backfill_keys(collection: Collection, keys: Dict[str, str]):
+    updates = []
+    updated = 0
+    query = {"$or": [{target: {"$exists": False}} for target in keys]}
+    for document in collection.find(query, {source: True for source in keys.values()}):
+        updates.append(UpdateOne({"_id": document["_id"]}, {"$set": {
+            target: normalize_key(document.get(source)) for target, source in keys.items()
+        }}))
+        if len(updates) == BATCH_SIZE:
+            updated += collection.bulk_write(updates, ordered=False).modified_count
+            updates = []
+    if updates:
+        updated += collection.bulk_write(updates, ordered=False).modified_count
+    return updated
+
+# fills in name_lower and code_lower on cities that were imported before they existed
+def backfill_city_keys(clients: MongoClients):
+    updated = backfill_keys(clients.cities.place_names.cities, {"name_lower": "name", "code_lower": "code"})
+    print(f"backfilled {updated} cities")
+
+# fills in item_lower on ratings so prefix searches can use the (category, item_lower) index
+def backfill_rating_keys(clients: MongoClients):
+    updated = backfill_keys(clients.meetup.meetupmaker.ratings, {"item_lower": "item"})
+    print(f"backfilled {updated} ratings")
+
+# recomputes the per-country bounding boxes that the cities endpoints and city-hedger read at startup
+def refresh_country_bounds_command(clients: MongoClients):
+    refreshed = refresh_country_bounds(clients.cities.place_names.cities)
+    print(f"refreshed bounds for {refreshed} countries")
+
+# groups of documents that share the same values for keys, as lists of whole documents
+def find_duplicates(collection: Collection, keys: List[str]):
+    groups = collection.aggregate([
+        { "$group": { "_id": { key: f"${key}" for key in keys }, "ids": { "$push": "$_id" }, "total": { "$sum": 1 } } },
+        { "$match": { "total": { "$gt": 1 } } },
+    ], allowDiskUse=True)
+    for group in groups:
+        yield list(collection.find({ "_id": { "$in": group["ids"] } }).sort("_id", 1))
+
+# run once the duplicates are gone, replaces older indexes on the same keys that lack the new options
+def replace_indexes(collection: Collection, indexes: List[Any]):
+    existing = collection.index_information()
+    for keys, options in indexes:
+        for name, index in existing.items():
+            if list(index["key"]) == keys and any(index.get(option) != value for option, value in options.items()):
+                collection.drop_index(name)
+        collection.create_index(keys, **options)
+
+def merge_quizzes(quizzes: List[Dict[str, Any]]):
+    best = {}
+    for quiz in quizzes:
+        for player in quiz.get("players", []):
+            if player["name"] not in best or player["score"] > best[player["name"]]["score"]:
+                best[player["name"]] = player
+    players = sorted(best.values(), key=lambda player: player["score"], reverse=True)[:QUIZ_LEADERBOARD_SIZE]
+    return {
+        "plays": sum(quiz.get("plays", 0) for quiz in quizzes),
+        "players": players
+    }
+
+# merges quizzes that were created twice by concurrent first submissions into the oldest copy,
+# then builds the unique quiz_name index that prevents it from happening again
+def dedupe_quizzes(clients: MongoClients):
+    database = clients.meetup.quiz
+    merged = 0
+    for name in database.list_collection_names():
+        quizzes = database[name]
+        for duplicates in find_duplicates(quizzes, ["quiz_name"]):
+            keep, *others = duplicates
+            quizzes.bulk_write([
+                UpdateOne({ "_id": keep["_id"] }, { "$set": merge_quizzes(duplicates) }),
+                DeleteMany({ "_id": { "$in": [quiz["_id"] for quiz in others] } }),
+            ])
+            merged += len(others)
+        replace_indexes(quizzes, QUIZ_INDEXES)
+    print(f"merged {merged} duplicate quizzes")
+
+RATING_KEYS = ("_id", "category", "item", "item_lower", "count", "sums")
+
+# sums add up across the copies, items rated before sums existed contribute average * count
+def merge_ratings(ratings: List[Dict[str, Any]]):
+    fields = set()
+    for rating in ratings:
+        fields.update(rating.get("sums", {}))
+        fields.update(key for key, value in rating.items() if key not in RATING_KEYS and isinstance(value, (int, float)))
+    count = sum(rating.get("count", 0) for rating in ratings)
+    sums = {
+        field: sum(rating.get("sums", {}).get(field, rating.get(field, 0) * rating.get("count", 0)) for rating in ratings)
+        for field in fields
+    }
+    return {
+        "item_lower": normalize_key(ratings[0]["item"]),
+        "count": count,
+        "sums": sums,
+        **{ field: sums[field] / count if count > 0 else 0 for field in fields }
+    }
+
+# merges items that were created twice by concurrent first ratings into the oldest copy,
+# then builds the unique (category, item) index that prevents it from happening again
+def dedupe_ratings(clients: MongoClients):
+    ratings = clients.meetup.meetupmaker.ratings
+    merged = 0
+    for duplicates in find_duplicates(ratings, ["category", "item"]):
+        keep, *others = duplicates
+        ratings.bulk_write([
+            UpdateOne({ "_id": keep["_id"] }, { "$set": merge_ratings(duplicates) }),
+            DeleteMany({ "_id": { "$in": [rating["_id"] for rating in others] } }),
+        ])
+        merged += len(others)
+    replace_indexes(ratings, MEETUPMAKER_INDEXES["ratings"])
+    print(f"merged {merged} duplicate ratings")
+
+# creates the sort index of every numeric field on the ratings, which are the ones the rating lists sort by
+def index_rating_fields(clients: MongoClients):
+    ratings = clients.meetup.meetupmaker.ratings
+    fields = ratings.aggregate([
+        { "$project": { "fields": { "$objectToArray": "$$ROOT" } } },
+        { "$unwind": "$fields" },
+        { "$match": { "fields.v": { "$type": "number" } } },
+        { "$group": { "_id": "$fields.k" } },
+    ], allowDiskUse=True)
+    fields = sorted(field["_id"] for field in fields)
+    for field in fields:
+        ratings.create_index(rating_sort_index(field))
+    print(f"indexed {len(fields)} rating fields: {', '.join(fields)}")
+
+COMMANDS = {
+    "backfill-city-keys": backfill_city_keys,
+    "backfill-rating-keys": backfill_rating_keys,
+    "refresh-country-bounds": refresh_country_bounds_command,
+    "dedupe-quizzes": dedupe_quizzes,
+    "dedupe-ratings": dedupe_ratings,
+    "index-rating-fields": index_rating_fields,
+}
+
+# usage: python maintenance.py <command>
+if __name__ == "__main__":
+    if len(sys.argv) != 2 or sys.argv[1] not in COMMANDS:
+        print(f"usage: python maintenance.py [{'|'.join(COMMANDS)}]")
+        sys.exit(1)
+
+    from main import mongo_clients
+    COMMANDS[sys.argv[1]](mongo_clients)
+    mongo_clients.close()
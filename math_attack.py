@@ -3,6 +3,7 @@ from enum import Enum
 from typing import List, Dict, Any
 import numpy as np
 import asyncio
+from room_registry import RoomRegistry
 
 class MathPlayerState(Enum):
     LOBBY = 'LOBBY'
@@ -150,6 +151,9 @@ class MathGameData():
             "players": self.get_player_life_status()
         })
 
+    def has_connections(self):
+        return any(player.websocket is not None for player in [*self.players.values(), *self.spectators.values()])
+
     def get_player_life_status(self):
         return {
             player_name: self.players[player_name].state.value for player_name in self.players
@@ -305,8 +309,9 @@ class MathAttackData():
     math_data: Dict[str, MathGameData]
 
     # init
-    def __init__(self):
+    def __init__(self, room_registry: RoomRegistry):
         self.math_data = {}
+        self.room_registry = room_registry
 
     def game_data_exists(self, game_id: str):
         return game_id in self.math_data
@@ -315,5 +320,11 @@ class MathAttackData():
         
         if game_id not in self.math_data:
             self.math_data[game_id] = MathGameData()
+            self.room_registry.register("math-attack", game_id, self.math_data[game_id],
+                                        lambda: self.remove_game_data(game_id))
+        self.room_registry.touch("math-attack", game_id)
         
-        return self.math_data[game_id]
\ No newline at end of file
+        return self.math_data[game_id]
+
+    async def remove_game_data(self, game_id: str):
+        self.math_data.pop(game_id, None)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from typing import Any, Dict, List
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from repositories import Repository
+
+class MeetupRepository():
+    repository: Repository
+
+    # every change is a single find_one_and_update that hands back only the fields the caller needs,
+    # a None result means the meetup does not exist
+    def __init__(self, repository: Repository):
+        self.repository = repository
+
+    async def update(self, meetup_id: str, update: Any, projection: Dict[str, Any]):
+        return await self.repository.find_one_and_update({ "_id": ObjectId(meetup_id) }, update,
+                                                         projection=projection,
+                                                         return_document=ReturnDocument.AFTER)
+
+    async def set_participant(self, meetup_id: str, name: str, free: List[str]):
+        return await self.update(meetup_id, { "$set": { f"participants.{name}": free } },
+                                 { "_id": False, "participants": True })
+
+    async def set_date(self, meetup_id: str, date: str):
+        return await self.update(meetup_id, { "$set": { "date": date } }, { "_id": True })
+
+    async def set_preference(self, meetup_id: str, name: str, preference: Dict[str, Any]):
+        return await self.update(meetup_id, { "$set": { f"preferences.{name}": preference } }, { "_id": True })
+
+    # removes the name from the likes of the matching recommendation if it is there, otherwise adds it.
+    # both are in-place updates of that one element, so concurrent likers cannot overwrite each other
+    async def toggle_like(self, meetup_id: str, name: str, timing: str, location: str):
+        array_filters = [{ "rec.timing": timing, "rec.location": location }]
+        unliked = await self.repository.find_one_and_update({
+            "_id": ObjectId(meetup_id),
+            "recommendations": { "$elemMatch": { "timing": timing, "location": location, "likes": name } }
+        }, { "$pull": { "recommendations.$[rec].likes": name } },
+           projection={ "_id": True }, array_filters=array_filters)
+        if unliked is not None:
+            return unliked
+        return await self.repository.find_one_and_update({ "_id": ObjectId(meetup_id) },
+                                                         { "$addToSet": { "recommendations.$[rec].likes": name } },
+                                                         projection={ "_id": True }, array_filters=array_filters)
+
+    async def set_timing(self, meetup_id: str, timing: str, location: Dict[str, Any]):
+        return await self.update(meetup_id, { "$set": { "timing": timing, "location": location } }, { "_id": True })
@@ -0,0 +1,194 @@
+import asyncio
+import time
+import uuid
+from typing import Any, Dict, List, Set
+from redis_client import RedisClient, Subscription
+
+PRESENCE_CHANNEL = "room-presence"
+# how long a room with no other known workers trusts that before reading the presence set again
+PRESENCE_CHECK_INTERVAL = 1
+# every worker refreshes its rooms' presence this often, and one that has not for PRESENCE_TTL seconds,
+# e.g. because it crashed without leaving them, is no longer counted as having them
+PRESENCE_HEARTBEAT_INTERVAL = 10
+PRESENCE_TTL = 30
+
+class LocalBus():
+    subscriptions: Dict[str, Any]
+
+    # same interface as RedisClient, for deployments with a single worker. messages are handed
+    # straight to the channel's receiver without a network round trip or serialization
+    def __init__(self):
+        self.subscriptions = {}
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        self.deliver(channel, message)
+
+    def deliver(self, channel: str, message: Dict[str, Any]):
+        subscription = self.subscriptions.get(channel)
+        if subscription is not None:
+            subscription.offer(message)
+
+    async def subscribe(self, channel: str, callback):
+        await self.attach(channel, Subscription(channel, callback))
+
+    async def attach(self, channel: str, receiver):
+        if channel in self.subscriptions:
+            await self.unsubscribe(channel)
+        self.subscriptions[channel] = receiver
+
+    async def unsubscribe(self, channel: str):
+        subscription = self.subscriptions.pop(channel, None)
+        if subscription is not None:
+            subscription.stop()
+
+    async def close(self):
+        for channel in list(self.subscriptions):
+            await self.unsubscribe(channel)
+
+class RemoteChannel():
+    # takes a room's messages from the redis listener and hands them to the bus, which delivers them
+    # to the room's receiver, so there is no queue of its own in between
+    def __init__(self, bus: "HybridBus", channel: str):
+        self.bus = bus
+        self.channel = channel
+
+    def offer(self, envelope: Dict[str, Any]):
+        self.bus.handle_remote(self.channel, envelope)
+
+    def stop(self):
+        pass
+
+class HybridBus():
+    remote_workers: Dict[str, Set[str]]
+    in_flight: Dict[str, int]
+    checked_at: Dict[str, float]
+
+    # delivers a room's messages locally right away while no other worker has the room. once another one
+    # does, every message, this worker's own included, goes through redis, so every worker applies them
+    # in redis's order. which workers have which rooms is kept in a redis sorted set per room, scored by
+    # each worker's last heartbeat, and changes are announced on PRESENCE_CHANNEL. the set itself is also
+    # read again every PRESENCE_CHECK_INTERVAL, for workers that joined but whose announcement has not
+    # arrived yet
+    def __init__(self, redis_client: RedisClient):
+        self.redis_client = redis_client
+        self.local = LocalBus()
+        self.worker_id = uuid.uuid4().hex
+        self.remote_workers = {}
+        # messages this worker sent through redis that have not come back yet. going back to local
+        # delivery before they do would apply later messages before them
+        self.in_flight = {}
+        self.checked_at = {}
+        self.presence_subscribed = False
+        self.heartbeat_task = None
+
+    def get_presence_key(self, channel: str):
+        return f"room-workers:{channel}"
+
+    def is_local(self, channel: str):
+        return not self.remote_workers.get(channel) and not self.in_flight.get(channel)
+
+    # the other workers that have refreshed the room within PRESENCE_TTL
+    async def read_workers(self, channel: str):
+        workers = await self.redis_client.client.zrangebyscore(self.get_presence_key(channel), time.time() - PRESENCE_TTL, "+inf")
+        return {worker.decode("utf-8") for worker in workers} - {self.worker_id}
+
+    async def check_presence(self, channel: str):
+        if time.monotonic() - self.checked_at.get(channel, 0) < PRESENCE_CHECK_INTERVAL:
+            return
+        self.checked_at[channel] = time.monotonic()
+        workers = await self.read_workers(channel)
+        if channel in self.remote_workers:
+            self.remote_workers[channel] |= workers
+
+    # the key expires with its last worker, so rooms whose workers all died do not stay behind
+    async def add_presence(self, channels: List[str]):
+        now = time.time()
+        async with self.redis_client.client.pipeline(transaction=False) as pipeline:
+            for channel in channels:
+                key = self.get_presence_key(channel)
+                pipeline.zadd(key, { self.worker_id: now })
+                pipeline.zremrangebyscore(key, "-inf", now - PRESENCE_TTL)
+                pipeline.expire(key, PRESENCE_TTL)
+            await pipeline.execute()
+
+    # workers that stopped refreshing a room are forgotten, workers announced while the sets are read are kept
+    async def refresh_presence(self):
+        channels = list(self.remote_workers)
+        await self.add_presence(channels)
+        for channel in channels:
+            known = set(self.remote_workers.get(channel, ()))
+            workers = await self.read_workers(channel)
+            if channel in self.remote_workers:
+                self.remote_workers[channel] -= known - workers
+                self.remote_workers[channel] |= workers
+
+    async def heartbeat(self):
+        while True:
+            await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+            try:
+                await self.refresh_presence()
+            except Exception as e:
+                print(f"presence heartbeat failed: {e}")
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        if channel in self.remote_workers and self.is_local(channel):
+            await self.check_presence(channel)
+        if self.is_local(channel):
+            self.local.deliver(channel, message)
+            return
+
+        self.in_flight[channel] = self.in_flight.get(channel, 0) + 1
+        try:
+            await self.redis_client.publish(channel, { "origin": self.worker_id, "message": message })
+        except Exception:
+            self.in_flight[channel] -= 1
+            raise
+
+    async def subscribe(self, channel: str, callback):
+        await self.attach(channel, Subscription(channel, callback))
+
+    async def attach(self, channel: str, receiver):
+        if not self.presence_subscribed:
+            self.presence_subscribed = True
+            await self.redis_client.subscribe(PRESENCE_CHANNEL, self.handle_presence)
+            self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+        await self.local.attach(channel, receiver)
+        await self.redis_client.attach(channel, RemoteChannel(self, channel))
+
+        # joins announced while the set is being read are kept
+        self.remote_workers[channel] = set()
+        await self.add_presence([channel])
+        self.remote_workers[channel] |= await self.read_workers(channel)
+        await self.redis_client.publish(PRESENCE_CHANNEL, { "type": "join", "channel": channel, "worker": self.worker_id })
+
+    async def unsubscribe(self, channel: str):
+        await self.local.unsubscribe(channel)
+        await self.redis_client.unsubscribe(channel)
+        self.remote_workers.pop(channel, None)
+        self.in_flight.pop(channel, None)
+        self.checked_at.pop(channel, None)
+        await self.redis_client.client.zrem(self.get_presence_key(channel), self.worker_id)
+        await self.redis_client.publish(PRESENCE_CHANNEL, { "type": "leave", "channel": channel, "worker": self.worker_id })
+
+    # this worker's own messages are applied when they come back, in the same order as everywhere else.
+    # a message the receiver drops has still come back
+    def handle_remote(self, channel: str, envelope: Dict[str, Any]):
+        if envelope["origin"] == self.worker_id and self.in_flight.get(channel):
+            self.in_flight[channel] -= 1
+        self.local.deliver(channel, envelope["message"])
+
+    async def handle_presence(self, data: Dict[str, Any]):
+        if data["worker"] == self.worker_id or data["channel"] not in self.remote_workers:
+            return
+        if data["type"] == "join":
+            self.remote_workers[data["channel"]].add(data["worker"])
+        else:
+            self.remote_workers[data["channel"]].discard(data["worker"])
+
+    async def close(self):
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        for channel in list(self.remote_workers):
+            await self.redis_client.client.zrem(self.get_presence_key(channel), self.worker_id)
+        await self.local.close()
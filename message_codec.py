@@ -0,0 +1,98 @@
+import json
+from typing import Any, Dict
+import numpy as np
+from fastapi import WebSocket
+from fastapi.websockets import WebSocketDisconnect
+
+# game payloads can hold numpy scalars and arrays
+def to_builtin(value: Any):
+    if isinstance(value, (np.generic, np.ndarray)):
+        return value.tolist()
+    raise TypeError(f"cannot serialize {type(value).__name__}")
+
+class JsonCodec():
+    name = "json"
+    binary = False
+
+    def encode(self, message: Any):
+        return json.dumps(message, default=to_builtin).encode("utf-8")
+
+    def decode(self, data: Any):
+        return json.loads(data)
+
+class OrjsonCodec():
+    name = "orjson"
+    binary = False
+
+    def __init__(self):
+        import orjson
+        self.orjson = orjson
+
+    def encode(self, message: Any):
+        return self.orjson.dumps(message, default=to_builtin, option=self.orjson.OPT_SERIALIZE_NUMPY)
+
+    def decode(self, data: Any):
+        return self.orjson.loads(data)
+
+class MsgpackCodec():
+    name = "msgpack"
+    binary = True
+
+    def __init__(self):
+        import msgpack
+        self.msgpack = msgpack
+
+    def encode(self, message: Any):
+        return self.msgpack.packb(message, default=to_builtin)
+
+    def decode(self, data: Any):
+        return self.msgpack.unpackb(data)
+
+CODECS = {
+    "json": JsonCodec,
+    "orjson": OrjsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+# orjson and msgpack are only imported when a deployment picks them
+def get_codec(name: str):
+    if name not in CODECS:
+        raise ValueError(f"unknown codec {name}, expected one of {list(CODECS)}")
+    return CODECS[name]()
+
+class WebSocketCodecs():
+    text: Any
+    binary: Dict[str, Any]
+
+    # text frames are JSON encoded with the deployment's JSON codec, clients that ask for the
+    # msgpack subprotocol get binary frames instead
+    def __init__(self, codec_name: str):
+        self.text = get_codec(codec_name) if codec_name != "msgpack" else get_codec("json")
+        self.binary = {}
+        try:
+            self.binary["msgpack"] = get_codec("msgpack")
+        except ImportError:
+            print("msgpack is not installed, websocket clients can only use json")
+
+    async def accept(self, websocket: WebSocket):
+        subprotocol = next((protocol for protocol in websocket.scope.get("subprotocols", []) if protocol in self.binary), None)
+        websocket.state.codec = self.binary[subprotocol] if subprotocol else self.text
+        await websocket.accept(subprotocol=subprotocol)
+
+    def get(self, websocket: WebSocket):
+        return getattr(websocket.state, "codec", self.text)
+
+    async def send(self, websocket: WebSocket, message: Any):
+        codec = self.get(websocket)
+        if codec.binary:
+            await websocket.send_bytes(codec.encode(message))
+        else:
+            await websocket.send_text(codec.encode(message).decode("utf-8"))
+
+    async def receive(self, websocket: WebSocket):
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000), message.get("reason"))
+        if message.get("bytes") is not None:
+            return self.get(websocket).decode(message["bytes"])
+        return self.text.decode(message["text"])
@@ -0,0 +1,34 @@
+import base64
+import json
+from typing import Any, Dict
+import pymongo
+from bson.objectid import ObjectId
+
+# cursors are opaque to clients, they hold the sort value and _id of the last item on the page
+def encode_cursor(value: Any, object_id: ObjectId):
+    return base64.urlsafe_b64encode(json.dumps([value, str(object_id)]).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str):
+    value, object_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    return value, ObjectId(object_id)
+
+# the value a (field, _id) sort sees, field can be a dotted path like sums.taste
+def get_path(document: Dict[str, Any], field: str):
+    value = document
+    for key in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+    return value
+
+# everything strictly after (value, _id) in (field, _id) order
+# missing values sort before everything ascending and after everything descending
+def keyset_query(field: str, sort_order: int, value: Any, object_id: ObjectId) -> Dict[str, Any]:
+    if sort_order == pymongo.ASCENDING:
+        if value is None:
+            return { "$or": [{ field: { "$ne": None } }, { field: None, "_id": { "$gt": object_id } }] }
+        return { "$or": [{ field: { "$gt": value } }, { field: value, "_id": { "$gt": object_id } }] }
+
+    if value is None:
+        return { field: None, "_id": { "$lt": object_id } }
+    return { "$or": [{ field: { "$lt": value } }, { field: value, "_id": { "$lt": object_id } }, { field: None }] }
@@ -5,6 +5,7 @@ from typing import List, Dict, Any
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketDisconnect
 from openai import OpenAI
+from room_registry import RoomRegistry
 
 user_example = """
 Purpose: school of computing orientation.
@@ -128,6 +129,9 @@ class QuipGameData():
             } for player_name in self.players
         }
     
+    def has_connections(self):
+        return any(player.websocket is not None for player in [*self.players.values(), *self.spectators.values()])
+
     def get_live_players(self):
         return [player_name for player_name in self.players]
     
@@ -387,9 +391,17 @@ class QuipData():
     total_count: int
 
     # init
-    def __init__(self):
+    def __init__(self, room_registry: RoomRegistry):
         self.games = {}
         self.total_count = 0
+        self.room_registry = room_registry
+
+    def add_game(self, game_id: str, game: QuipGameData):
+        self.games[game_id] = game
+        self.room_registry.register("quip-ai", game_id, game, lambda: self.remove_game(game_id))
+
+    async def remove_game(self, game_id: str):
+        self.games.pop(game_id, None)
     
     def has_reached_limit(self):
         return self.total_count >= 100000
\ No newline at end of file
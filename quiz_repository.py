@@ -0,0 +1,53 @@
+from typing import Any, Dict, List
+from pymongo import ReturnDocument
+from indexes import ensure_quiz_indexes
+from repositories import Repository
+
+QUIZ_LEADERBOARD_SIZE = 10
+
+# keeps each name's best score and the top 10 overall, in a single atomic update
+def quiz_score_update(name: str, score: int):
+  existing_players = { '$ifNull': ['$players', []] }
+  other_players = { '$filter': { 'input': existing_players, 'cond': { '$ne': ['$$this.name', { '$literal': name }] } } }
+  previous_best = { '$max': {
+    '$map': {
+      'input': { '$filter': { 'input': existing_players, 'cond': { '$eq': ['$$this.name', { '$literal': name }] } } },
+      'in': '$$this.score'
+    }
+  } }
+  player_data = {
+    'name': { '$literal': name },
+    'score': { '$max': [score, previous_best] },
+  }
+  return [{
+    '$set': {
+      'plays': { '$add': [{ '$ifNull': ['$plays', 0] }, 1] },
+      'players': { '$slice': [
+        { '$sortArray': { 'input': { '$concatArrays': [other_players, [player_data]] }, 'sortBy': { 'score': -1 } } },
+        QUIZ_LEADERBOARD_SIZE
+      ] }
+    }
+  }]
+
+class QuizRepository():
+  repository: Repository
+
+  # one quiz type, each quiz in it is a single document keyed by the unique quiz_name
+  def __init__(self, repository: Repository):
+    self.repository = repository
+
+  async def submit_score(self, quiz_name: str, name: str, score: int):
+    await ensure_quiz_indexes(self.repository)
+    return await self.repository.find_one_and_update({
+      'quiz_name': quiz_name
+    }, quiz_score_update(name, score), upsert=True, return_document=ReturnDocument.AFTER, projection={ '_id': 0, 'players': 1, 'plays': 1 })
+
+  # creates the quiz if it is new, concurrent first reads all end up with the same document
+  async def get(self, quiz_name: str):
+    await ensure_quiz_indexes(self.repository)
+    quiz = await self.repository.find_one({ 'quiz_name': quiz_name }, { '_id': 0 })
+    if quiz is not None:
+      return quiz
+    return await self.repository.find_one_and_update({
+      'quiz_name': quiz_name
+    }, { '$setOnInsert': { 'players': [], 'plays': 0 } }, upsert=True, return_document=ReturnDocument.AFTER, projection={ '_id': 0 })
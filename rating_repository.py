@@ -0,0 +1,43 @@
+from typing import Any, Dict, List, Tuple
+from bson.objectid import ObjectId
+from db import normalize_key
+from pagination import encode_cursor, get_path, keyset_query
+from repositories import Repository
+
+# running sums and the count are kept per item, and the averages are recomputed from them in the same update
+def rating_update(item_name: str, fields: List[str], deltas: Dict[str, Any], count_delta: int):
+    add_to_sums = {
+        "item_lower": { "$literal": normalize_key(item_name) },
+        "count": { "$add": [{ "$ifNull": ["$count", 0] }, count_delta] }
+    }
+    for field in fields:
+        # items rated before sums existed start from average * count
+        previous_sum = { "$ifNull": [f"$sums.{field}", { "$multiply": [{ "$ifNull": [f"${field}", 0] }, { "$ifNull": ["$count", 0] }] }] }
+        add_to_sums[f"sums.{field}"] = { "$add": [previous_sum, { "$literal": deltas[field] }] }
+
+    averages = {
+        field: { "$cond": [{ "$gt": ["$count", 0] }, { "$divide": [f"$sums.{field}", "$count"] }, 0] }
+        for field in fields
+    }
+    return [{ "$set": add_to_sums }, { "$set": averages }]
+
+class RatingRepository():
+    repository: Repository
+
+    # one document per (category, item), kept unique by its index so concurrent first ratings share it
+    def __init__(self, repository: Repository):
+        self.repository = repository
+
+    async def rate(self, category: str, item_name: str, fields: List[str], deltas: Dict[str, Any], count_delta: int):
+        return await self.repository.update_one({ "category": category, "item": item_name },
+                                                rating_update(item_name, fields, deltas, count_delta), upsert=True)
+
+    # the page after the cursor's (value, _id) in (field, _id) order, and the cursor of the page after it
+    async def page(self, query: Dict[str, Any], field: str, sort_order: int, limit: int, after: Tuple[Any, ObjectId] = None):
+        if after is not None:
+            query = { "$and": [query, keyset_query(field, sort_order, *after)] }
+        ratings = await self.repository.find(query, sort=[(field, sort_order), ("_id", sort_order)], limit=limit)
+        next_cursor = None
+        if len(ratings) == limit:
+            next_cursor = encode_cursor(get_path(ratings[-1], field), ratings[-1]["_id"])
+        return ratings, next_cursor
@@ -0,0 +1,275 @@
+from typing import Any, Dict, List, Tuple
+from collections import OrderedDict
+import hashlib
+import json
+import threading
+import numpy as np
+from spatial_index import GridIndex
+
+TIMING_INTERVAL = 15
+MINUTES_PER_DAY = 24 * 60
+KM_PER_DEGREE = 111.33
+MAX_DISTANCE_KM = 20
+RECOMMENDATIONS_PER_TIMING = 10
+
+def parse_minutes(time: str):
+    hours, minutes = time.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def format_minutes(minutes: int):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def preference_hash(preference: Dict[str, Any]):
+    return hashlib.sha1(json.dumps(preference, sort_keys=True).encode("utf-8")).hexdigest()
+
+class MallTable():
+    names: List[str]
+    lat: np.ndarray
+    lng: np.ndarray
+    weights: np.ndarray
+    index: GridIndex
+
+    def __init__(self, malls: List[Dict[str, Any]]):
+        # later malls with the same name replace earlier ones
+        malls_by_name = {mall["name"]: mall for mall in malls}
+        self.names = list(malls_by_name)
+        self.lat = np.array([mall["lat"] for mall in malls_by_name.values()], dtype=np.float64)
+        self.lng = np.array([mall["lng"] for mall in malls_by_name.values()], dtype=np.float64)
+        dist_score = np.array([mall["dist_score"] for mall in malls_by_name.values()], dtype=np.float64)
+        stores = np.array([mall["stores"] for mall in malls_by_name.values()], dtype=np.float64)
+        # these factors only depend on the mall, so compute them once
+        self.weights = (1 + np.log10(1 + dist_score)) * (1 + np.log10(1 + stores))
+        # one cell per search radius, so only the 3x3 block around a position needs to be checked
+        self.index = GridIndex(self.lat, self.lng, MAX_DISTANCE_KM / KM_PER_DEGREE)
+
+class PreferenceArrays():
+    names: List[str]
+    start: np.ndarray
+    end: np.ndarray
+    duration: np.ndarray
+    start_lat: np.ndarray
+    start_lng: np.ndarray
+    end_lat: np.ndarray
+    end_lng: np.ndarray
+
+    def __init__(self, preferences: Dict[str, Dict[str, Any]]):
+        self.names = list(preferences)
+        values = list(preferences.values())
+        self.start = np.array([parse_minutes(pref["start_time"]) for pref in values], dtype=np.int64)
+        self.end = np.array([parse_minutes(pref["end_time"]) for pref in values], dtype=np.int64)
+        self.duration = (self.end - self.start) % MINUTES_PER_DAY
+        self.start_lat = np.array([pref["start_lat"] for pref in values], dtype=np.float64)
+        self.start_lng = np.array([pref["start_lng"] for pref in values], dtype=np.float64)
+        self.end_lat = np.array([pref["end_lat"] for pref in values], dtype=np.float64)
+        self.end_lng = np.array([pref["end_lng"] for pref in values], dtype=np.float64)
+
+    # timings in minutes with the indices of everyone free at that time,
+    # most popular first and in order of first appearance on ties
+    def bucket_timings(self):
+        timings = {}
+        for person in range(len(self.names)):
+            first = self.start[person] + TIMING_INTERVAL - self.start[person] % TIMING_INTERVAL
+            last = self.end[person] - self.end[person] % TIMING_INTERVAL
+            for timing in range(int(first), int(last) + 1, TIMING_INTERVAL):
+                if timing not in timings:
+                    timings[timing] = []
+                timings[timing].append(person)
+        return sorted(timings.items(), key=lambda x: len(x[1]), reverse=True)
+
+class Contribution():
+    slots: np.ndarray
+    malls: np.ndarray
+    values: np.ndarray
+
+    # one person's sigmoid scores, as (timing slot, mall, value) triples
+    def __init__(self, slots: np.ndarray, malls: np.ndarray, values: np.ndarray):
+        self.slots = slots
+        self.malls = malls
+        self.values = values
+
+class MeetupState():
+    table: MallTable
+    hashes: Dict[str, str]
+    contributions: Dict[str, Contribution]
+    sums: Dict[int, np.ndarray]
+    counts: Dict[int, np.ndarray]
+    updates: int
+
+    # running per-timing totals for one meetup, so a changed preference only
+    # needs that person's contribution to be swapped out
+    def __init__(self, table: MallTable):
+        self.table = table
+        self.hashes = {}
+        self.contributions = {}
+        self.sums = {}
+        self.counts = {}
+        self.updates = 0
+
+    def apply(self, contribution: Contribution, sign: int):
+        for slot in np.unique(contribution.slots).tolist():
+            if slot not in self.sums:
+                self.sums[slot] = np.zeros(len(self.table.names), dtype=np.float64)
+                self.counts[slot] = np.zeros(len(self.table.names), dtype=np.int64)
+            in_slot = contribution.slots == slot
+            np.add.at(self.sums[slot], contribution.malls[in_slot], sign * contribution.values[in_slot])
+            np.add.at(self.counts[slot], contribution.malls[in_slot], sign)
+
+    def add(self, name: str, key: str, contribution: Contribution):
+        self.hashes[name] = key
+        self.contributions[name] = contribution
+        self.apply(contribution, 1)
+
+    def remove(self, name: str):
+        self.apply(self.contributions.pop(name), -1)
+        self.hashes.pop(name)
+
+    def rows(self, timings: List[Tuple[int, List[int]]]):
+        empty_sums = np.zeros(len(self.table.names), dtype=np.float64)
+        empty_counts = np.zeros(len(self.table.names), dtype=np.int64)
+        sums = np.stack([self.sums.get(timing // TIMING_INTERVAL, empty_sums) for timing, _ in timings])
+        counts = np.stack([self.counts.get(timing // TIMING_INTERVAL, empty_counts) for timing, _ in timings])
+        return sums, counts > 0
+
+class RecommendationEngine():
+    malls_version: Any
+    table: MallTable
+    states: "OrderedDict[str, MeetupState]"
+
+    def __init__(self, max_states: int = 128, check_interval: int = 20):
+        self.malls_version = None
+        self.table = None
+        # separate generator so the games' seeded np.random state is left alone
+        self.rng = np.random.default_rng()
+        self.states = OrderedDict()
+        self.max_states = max_states
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+
+    # malls_version changes whenever the malls are reloaded, which is the only time the table is rebuilt
+    def get_table(self, malls: List[Dict[str, Any]], malls_version: Any):
+        if self.table is None or malls_version != self.malls_version:
+            self.table = MallTable(malls)
+            self.malls_version = malls_version
+        return self.table
+
+    # distance sigmoid of every in-range mall for every (timing, person) pair, as
+    # (index into timings, mall, value) triples
+    def pair_contributions(self, arrays: PreferenceArrays, timings: List[Tuple[int, List[int]]], table: MallTable):
+        people = np.concatenate([np.array(people, dtype=np.int64) for _, people in timings])
+        minutes = np.concatenate([np.full(len(people_at_timing), timing, dtype=np.int64) for timing, people_at_timing in timings])
+        timing_indices = np.concatenate([np.full(len(people_at_timing), index, dtype=np.int64) for index, (_, people_at_timing) in enumerate(timings)])
+
+        progress = ((minutes - arrays.start[people]) % MINUTES_PER_DAY) / arrays.duration[people]
+        lat = arrays.start_lat[people] + (arrays.end_lat[people] - arrays.start_lat[people]) * progress
+        lng = arrays.start_lng[people] + (arrays.end_lng[people] - arrays.start_lng[people]) * progress
+
+        # only malls in nearby grid cells are measured
+        positions, malls = table.index.candidates(lat, lng, MAX_DISTANCE_KM / KM_PER_DEGREE)
+        distance = KM_PER_DEGREE * np.sqrt((lat[positions] - table.lat[malls]) ** 2 + (lng[positions] - table.lng[malls]) ** 2)
+        in_range = distance <= MAX_DISTANCE_KM
+        positions, malls, distance = positions[in_range], malls[in_range], distance[in_range]
+
+        # sigmoid that favours closer destinations
+        return timing_indices[positions], malls, 1 / (1 + np.exp(0.1 * distance))
+
+    # sum of the distance sigmoid over everyone free at each timing, for every mall
+    def score_timings(self, arrays: PreferenceArrays, timings: List[Tuple[int, List[int]]], table: MallTable):
+        timing_indices, malls, values = self.pair_contributions(arrays, timings, table)
+        sums = np.zeros((len(timings), len(table.names)), dtype=np.float64)
+        reached = np.zeros((len(timings), len(table.names)), dtype=bool)
+        np.add.at(sums, (timing_indices, malls), values)
+        reached[timing_indices, malls] = True
+        return sums, reached
+
+    def person_contribution(self, preference: Dict[str, Any], table: MallTable):
+        arrays = PreferenceArrays({"": preference})
+        timings = arrays.bucket_timings()
+        if not timings:
+            empty = np.zeros(0, dtype=np.int64)
+            return Contribution(empty, empty, np.zeros(0, dtype=np.float64))
+
+        timing_indices, malls, values = self.pair_contributions(arrays, timings, table)
+        slots = np.array([timing // TIMING_INTERVAL for timing, _ in timings], dtype=np.int64)
+        return Contribution(slots[timing_indices], malls, values)
+
+    def recommend(self, preferences: Dict[str, Dict[str, Any]], malls: List[Dict[str, Any]], malls_version: Any):
+        table = self.get_table(malls, malls_version)
+        arrays = PreferenceArrays(preferences)
+        timings = arrays.bucket_timings()
+        if not timings or not table.names:
+            return []
+
+        sums, reached = self.score_timings(arrays, timings, table)
+        return self.rank(timings, sums, reached, table)
+
+    # same as recommend, but reuses the contributions of everyone whose preference is unchanged
+    # since the last call for this meetup
+    def recommend_incremental(self, meetup_id: str, preferences: Dict[str, Dict[str, Any]], malls: List[Dict[str, Any]], malls_version: Any):
+        try:
+            with self.lock:
+                table = self.get_table(malls, malls_version)
+                arrays = PreferenceArrays(preferences)
+                timings = arrays.bucket_timings()
+                if not timings or not table.names:
+                    return []
+
+                state = self.update_state(meetup_id, preferences, table)
+                sums, reached = state.rows(timings)
+
+                # every so often make sure the running totals still agree with a full recompute
+                state.updates += 1
+                if state.updates % self.check_interval == 0:
+                    full_sums, full_reached = self.score_timings(arrays, timings, table)
+                    if not (np.array_equal(reached, full_reached) and np.allclose(sums, full_sums)):
+                        print(f"recommendation state for {meetup_id} drifted, rebuilding")
+                        self.states.pop(meetup_id, None)
+                        sums, reached = full_sums, full_reached
+
+                return self.rank(timings, sums, reached, table)
+        except Exception as e:
+            print(f"incremental recommendation failed for {meetup_id}: {e}")
+            with self.lock:
+                self.states.pop(meetup_id, None)
+            return self.recommend(preferences, malls, malls_version)
+
+    def update_state(self, meetup_id: str, preferences: Dict[str, Dict[str, Any]], table: MallTable):
+        state = self.states.get(meetup_id)
+        if state is None or state.table is not table:
+            state = MeetupState(table)
+
+        for name in list(state.hashes):
+            if name not in preferences:
+                state.remove(name)
+
+        for name, preference in preferences.items():
+            key = preference_hash(preference)
+            if state.hashes.get(name) == key:
+                continue
+            if name in state.hashes:
+                state.remove(name)
+            state.add(name, key, self.person_contribution(preference, table))
+
+        self.states[meetup_id] = state
+        self.states.move_to_end(meetup_id)
+        while len(self.states) > self.max_states:
+            self.states.popitem(last=False)
+        return state
+
+    def rank(self, timings: List[Tuple[int, List[int]]], sums: np.ndarray, reached: np.ndarray, table: MallTable):
+        recommendations = []
+        blacklisted = np.zeros(len(table.names), dtype=bool)
+        for index, (timing, _) in enumerate(timings):
+            candidates = np.flatnonzero(reached[index] & ~blacklisted)
+            if len(candidates) == 0:
+                continue
+
+            scores = sums[index, candidates] * table.weights[candidates] * (1 + self.rng.random(len(candidates)))
+
+            # the worst quarter is not considered for later timings
+            worst = np.argsort(scores, kind="stable")[:len(candidates) // 4]
+            blacklisted[candidates[worst]] = True
+
+            best = np.argsort(-scores, kind="stable")[:RECOMMENDATIONS_PER_TIMING]
+            recommendations.extend((format_minutes(timing), table.names[candidates[i]], float(scores[i])) for i in best)
+
+        return sorted(recommendations, key=lambda x: x[2], reverse=True)
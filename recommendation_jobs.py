@@ -0,0 +1,178 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Tuple
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from recommendation_engine import RecommendationEngine
+from reference_cache import ReferenceCache
+from repositories import Repositories
+
+MAX_RECOMMENDATIONS = 20
+
+# each worker process keeps its own engine, and with it its own per-meetup state
+worker_engine: RecommendationEngine = None
+
+def init_worker(max_states: int, check_interval: int):
+    global worker_engine
+    worker_engine = RecommendationEngine(max_states, check_interval)
+
+# malls are only sent to a worker that does not have this version yet, None asks for them
+def run_recommendation(meetup_id: str, preferences: Dict[str, Any], malls: List[Dict[str, Any]], malls_version: Any):
+    if malls is None and worker_engine.malls_version != malls_version:
+        return None
+    return worker_engine.recommend_incremental(meetup_id, preferences, malls, malls_version)
+
+def hash_preferences(preferences: Dict[str, Any]):
+    return hashlib.sha1(json.dumps(preferences, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# liked recommendations are always kept, the rest is topped up from the new ones
+def merge_recommendations(current_recommendations: List[Dict[str, Any]], sorted_recommendations: List[Any]):
+    recommendations_as_dicts = [
+        {
+            "timing": recommendation[0],
+            "location": recommendation[1],
+            "score": recommendation[2],
+            "likes": []
+        } for recommendation in sorted_recommendations
+    ]
+    liked_recommendations = [recommendation for recommendation in current_recommendations if len(recommendation["likes"]) > 0]
+    # new recommendations should be of size 20
+    new_recommendations = liked_recommendations
+    new_recommendations_set = set()
+    for rec in liked_recommendations:
+        new_recommendations_set.add((rec["timing"], rec["location"]))
+    for recommendation in recommendations_as_dicts:
+        if len(new_recommendations) == MAX_RECOMMENDATIONS:
+            break
+        if (recommendation["timing"], recommendation["location"]) not in new_recommendations_set:
+            new_recommendations.append(recommendation)
+            new_recommendations_set.add((recommendation["timing"], recommendation["location"]))
+    return new_recommendations
+
+class RecommendationJob():
+    job_id: str
+    meetup_id: str
+    preferences: Dict[str, Any]
+    status: str
+    result: Dict[str, Any]
+    done: asyncio.Event
+    created_at: float
+
+    def __init__(self, meetup_id: str, preferences: Dict[str, Any]):
+        self.job_id = uuid.uuid4().hex
+        self.meetup_id = meetup_id
+        self.preferences = preferences
+        self.status = "pending"
+        self.result = None
+        self.done = asyncio.Event()
+        self.created_at = time.time()
+
+    def get_data(self):
+        return {
+            "job_id": self.job_id,
+            "meetup_id": self.meetup_id,
+            "status": self.status,
+            **(self.result or {})
+        }
+
+class RecommendationJobs():
+    jobs: Dict[str, RecommendationJob]
+    in_flight: Dict[Tuple[str, str], RecommendationJob]
+    latest: Dict[str, RecommendationJob]
+
+    def __init__(self, repositories: Repositories, reference_cache: ReferenceCache, max_workers: int, result_ttl: float, max_states: int, check_interval: int):
+        self.repositories = repositories
+        self.reference_cache = reference_cache
+        self.result_ttl = result_ttl
+        # one process per shard, a meetup always goes to the same one, so its state from the last
+        # recommendation is there to be reused
+        self.executors = [ProcessPoolExecutor(1, initializer=init_worker, initargs=(max_states, check_interval))
+                          for _ in range(max_workers)]
+        self.jobs = {}
+        self.in_flight = {}
+        self.latest = {}
+
+    # requests for a meetup whose preferences have not changed share the job that is already running,
+    # a change in preferences starts a new one
+    async def submit(self, meetup_id: str):
+        try:
+            meetup = await self.repositories.meetupmaker("meetup").find_one({ "_id": ObjectId(meetup_id) }, { "preferences": True })
+        except InvalidId:
+            meetup = None
+        preferences = meetup["preferences"] if meetup is not None else None
+        key = (meetup_id, hash_preferences(preferences))
+        if key in self.in_flight:
+            return self.in_flight[key]
+
+        job = RecommendationJob(meetup_id, preferences)
+        self.jobs[job.job_id] = job
+        self.in_flight[key] = job
+        self.latest[meetup_id] = job
+        asyncio.create_task(self.run(job, key))
+        return job
+
+    def get_executor(self, meetup_id: str):
+        return self.executors[zlib.crc32(meetup_id.encode("utf-8")) % len(self.executors)]
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def wait(self, job: RecommendationJob, timeout: float = None):
+        try:
+            await asyncio.wait_for(job.done.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    async def run(self, job: RecommendationJob, key: Tuple[str, str]):
+        try:
+            job.status = "running"
+            job.result = await self.recommend(job)
+            job.status = "error" if "error" in job.result else "done"
+        except Exception as e:
+            print(f"recommendation job {job.job_id} failed: {e}")
+            job.status = "error"
+            job.result = { "error": "Recommendation failed" }
+        finally:
+            self.in_flight.pop(key, None)
+            if self.latest.get(job.meetup_id) is job:
+                self.latest.pop(job.meetup_id)
+            job.done.set()
+            asyncio.get_running_loop().call_later(self.result_ttl, self.jobs.pop, job.job_id, None)
+
+    async def recommend(self, job: RecommendationJob):
+        meetup_id = job.meetup_id
+        if job.preferences is None:
+            return { "error": "Meetup not found" }
+
+        malls = await self.reference_cache.get_entry("malls")
+
+        # scoring is CPU bound, keep it off the event loop and the threadpool
+        loop = asyncio.get_running_loop()
+        executor = self.get_executor(meetup_id)
+        sorted_recommendations = await loop.run_in_executor(
+            executor, run_recommendation, meetup_id, job.preferences, None, malls.loaded_at)
+        if sorted_recommendations is None:
+            sorted_recommendations = await loop.run_in_executor(
+                executor, run_recommendation, meetup_id, job.preferences, malls.data, malls.loaded_at)
+
+        # re-read so likes made while scoring are not lost
+        meetups = self.repositories.meetupmaker("meetup")
+        meetup = await meetups.find_one({ "_id": ObjectId(meetup_id) }, { "recommendations": True })
+        new_recommendations = merge_recommendations(meetup["recommendations"], sorted_recommendations)
+        # a job started after this one used newer preferences, so this one must not overwrite its results
+        if self.latest.get(meetup_id) is job:
+            await meetups.update_one({ "_id": ObjectId(meetup_id) },
+                                     { "$set": { "recommendations": new_recommendations }})
+        return {
+            "recommendations": new_recommendations
+        }
+
+    def shutdown(self):
+        for executor in self.executors:
+            executor.shutdown(wait=False, cancel_futures=True)
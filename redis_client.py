@@ -1,27 +1,152 @@
-from typing import Dict, Any
+from typing import Dict, Any, Awaitable, Callable
 import redis.asyncio as redis
-import json
+import asyncio
+from message_codec import JsonCodec
+
+RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 30
+
+class Subscription:
+		channel: str
+		callback: Callable[[Dict[str, Any]], Awaitable[None]]
+		queue: asyncio.Queue
+		task: asyncio.Task
+
+		# messages of one channel are handled in order, without holding up other channels
+		def __init__(self, channel: str, callback):
+				self.channel = channel
+				self.callback = callback
+				self.queue = asyncio.Queue()
+				self.stopped = False
+				self.task = asyncio.create_task(self.consume())
+
+		def offer(self, data: Dict[str, Any]):
+				self.queue.put_nowait(data)
+
+		async def consume(self):
+				while not self.stopped:
+						data = await self.queue.get()
+						try:
+								await self.callback(data)
+						except Exception as e:
+								print(f"error handling message on {self.channel}: {e}")
+
+		# messages still queued are dropped, unless a message of the channel is the one stopping it,
+		# which is left to finish
+		def stop(self):
+				self.stopped = True
+				if self.task is not asyncio.current_task():
+						self.task.cancel()
 
 class RedisClient:
-		def __init__(self, redis_host, redis_password, redis_port):
+		subscriptions: Dict[str, Any]
+
+		# every channel of the process shares one pubsub connection, messages are routed
+		# to the channel's callback by the listener task
+		def __init__(self, redis_host, redis_password, redis_port, codec=None):
+				# every worker has to use the same codec, since they read each other's messages
+				self.codec = codec or JsonCodec()
 				self.client = redis.Redis(
 						host=redis_host,
 						port=redis_port,
 						password=redis_password,
 				)
+				self.pubsub = self.client.pubsub()
+				self.subscriptions = {}
+				self.listener = None
+				# set when a subscribe fails, the listener then subscribes every channel again
+				self.needs_resubscribe = False
+				# the pubsub object is not safe to (re)connect from several tasks at once
+				self.lock = asyncio.Lock()
 		
 		async def publish(self, channel: str, message: Dict[str, Any]):
 				print('pub', channel, message)
-				await self.client.publish(channel, json.dumps(message))
+				await self.client.publish(channel, self.codec.encode(message))
 
 		async def subscribe(self, channel: str, callback):
-				pubsub = self.client.pubsub()
-				await pubsub.subscribe(channel)
-				print('subscribed to', channel)
-				async for message in pubsub.listen():
-						print('sub', message)
-						if message["type"] == "message":
-								await callback(json.loads(message['data'].decode('utf-8')))
+				await self.attach(channel, Subscription(channel, callback))
+
+		# anything with offer and stop, like a room's mailbox, can take the channel's messages
+		# straight from the listener, without a Subscription queued in front of it
+		async def attach(self, channel: str, receiver):
+				if channel in self.subscriptions:
+						await self.unsubscribe(channel)
+				self.subscriptions[channel] = receiver
+				try:
+						async with self.lock:
+								await self.pubsub.subscribe(channel)
+						print('subscribed to', channel)
+				except redis.ConnectionError as e:
+						# the listener subscribes it along with the rest once it reconnects
+						print(f"failed to subscribe to {channel}: {e}")
+						self.needs_resubscribe = True
+				if self.listener is None or self.listener.done():
+						self.listener = asyncio.create_task(self.listen())
 
 		async def unsubscribe(self, channel: str):
-				self.client.unsubscribe(channel)
\ No newline at end of file
+				subscription = self.subscriptions.pop(channel, None)
+				if subscription is None:
+						return
+				subscription.stop()
+				try:
+						async with self.lock:
+								await self.pubsub.unsubscribe(channel)
+				except redis.ConnectionError as e:
+						# the channel is left out when the listener resubscribes
+						print(f"failed to unsubscribe from {channel}: {e}")
+
+		async def listen(self):
+				while True:
+						# a failed first subscribe leaves no connection, and a later subscribe that works only
+						# subscribes its own channel, so every channel has to be subscribed again
+						if self.needs_resubscribe or (self.subscriptions and self.pubsub.connection is None):
+								await self.reconnect()
+								continue
+						# nothing to read until the first channel is subscribed on a new connection
+						if self.pubsub.connection is None:
+								await asyncio.sleep(1)
+								continue
+						try:
+								message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+						except (redis.ConnectionError, redis.TimeoutError) as e:
+								print(f"redis pubsub connection lost: {e}")
+								await self.reconnect()
+								continue
+						if message is None or message["type"] != "message":
+								continue
+						# a message that cannot be decoded is dropped, it must not stop the listener every channel relies on
+						try:
+								subscription = self.subscriptions.get(message["channel"].decode('utf-8'))
+								if subscription is not None:
+										subscription.offer(self.codec.decode(message['data']))
+						except Exception as e:
+								print(f"dropping message on {message['channel']}: {e}")
+
+		# replaces the pubsub connection and subscribes every current channel on it again
+		async def reconnect(self):
+				delay = RECONNECT_DELAY
+				while True:
+						try:
+								async with self.lock:
+										try:
+												await self.pubsub.aclose()
+										except Exception:
+												pass
+										self.pubsub = self.client.pubsub()
+										self.needs_resubscribe = False
+										if self.subscriptions:
+												await self.pubsub.subscribe(*self.subscriptions)
+								print(f"resubscribed to {len(self.subscriptions)} channels")
+								return
+						except redis.ConnectionError as e:
+								print(f"redis resubscribe failed, retrying in {delay}s: {e}")
+								await asyncio.sleep(delay)
+								delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+		async def close(self):
+				if self.listener is not None:
+						self.listener.cancel()
+				for channel in list(self.subscriptions):
+						self.subscriptions.pop(channel).stop()
+				await self.pubsub.aclose()
+				await self.client.aclose()
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict
+from pymongo import ReturnDocument
+from repositories import Repository
+
+class ReferenceEntry():
+    data: Any
+    body: bytes
+    loaded_at: float
+    version: int
+
+    def __init__(self, data: Any, version: int):
+        self.data = data
+        self.version = version
+        # serialize once so hot GETs can return the bytes as they are
+        self.body = json.dumps(data).encode("utf-8")
+        self.loaded_at = time.monotonic()
+
+class ReferenceCache():
+    loaders: Dict[str, Callable[[], Awaitable[Any]]]
+    entries: Dict[str, ReferenceEntry]
+    locks: Dict[str, asyncio.Lock]
+    shared_versions: Dict[str, int]
+
+    # read-through cache for collections that rarely change.
+    # invalidations bump a version kept in mongo, which every worker checks at most once per version_check_interval
+    def __init__(self, ttl: float, versions: Repository = None, version_check_interval: float = 5):
+        self.ttl = ttl
+        self.versions = versions
+        self.version_check_interval = version_check_interval
+        self.loaders = {}
+        self.entries = {}
+        self.locks = {}
+        self.shared_versions = {}
+        self.checked_at = None
+        self.version_lock = asyncio.Lock()
+
+    def register(self, name: str, loader: Callable[[], Awaitable[Any]]):
+        self.loaders[name] = loader
+        self.locks[name] = asyncio.Lock()
+
+    def is_version_checked(self):
+        return self.checked_at is not None and time.monotonic() - self.checked_at < self.version_check_interval
+
+    async def check_versions(self):
+        if self.versions is None or self.is_version_checked():
+            return
+        async with self.version_lock:
+            if self.is_version_checked():
+                return
+            try:
+                documents = await self.versions.find({}, { "version": True })
+                self.shared_versions = { document["_id"]: document["version"] for document in documents }
+            except Exception as e:
+                # keep serving what is cached, the next check tries again
+                print(f"failed to check reference versions: {e}")
+            self.checked_at = time.monotonic()
+
+    def is_fresh(self, name: str, entry: ReferenceEntry):
+        return (entry is not None and time.monotonic() - entry.loaded_at < self.ttl
+                and entry.version == self.shared_versions.get(name, 0))
+
+    async def get_entry(self, name: str):
+        await self.check_versions()
+        entry = self.entries.get(name)
+        if self.is_fresh(name, entry):
+            return entry
+
+        # only one request reloads, the rest wait for it
+        async with self.locks[name]:
+            entry = self.entries.get(name)
+            if self.is_fresh(name, entry):
+                return entry
+            # read before loading, so an invalidation during the load triggers another one
+            version = self.shared_versions.get(name, 0)
+            entry = ReferenceEntry(await self.loaders[name](), version)
+            self.entries[name] = entry
+            return entry
+
+    async def get(self, name: str):
+        return (await self.get_entry(name)).data
+
+    async def get_body(self, name: str):
+        return (await self.get_entry(name)).body
+
+    # returns the new version of every invalidated name
+    async def invalidate(self, name: str = None):
+        names = list(self.loaders) if name is None else [name]
+        for name in names:
+            self.entries.pop(name, None)
+            if self.versions is not None:
+                document = await self.versions.find_one_and_update({ "_id": name }, { "$inc": { "version": 1 } },
+                                                                   upsert=True, return_document=ReturnDocument.AFTER)
+                self.shared_versions[name] = document["version"]
+            else:
+                self.shared_versions[name] = self.shared_versions.get(name, 0) + 1
+        return { name: self.shared_versions[name] for name in names }
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Any, Dict, List, Tuple
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection
+from pymongo.errors import DuplicateKeyError
+from db import MongoClients
+
+STREAM_BATCH_SIZE = 500
+
+class Repository():
+    collection: AsyncIOMotorCollection
+    semaphore: asyncio.Semaphore
+
+    # every query goes through the semaphore so one slow collection cannot
+    # take up all of the worker's connections
+    def __init__(self, collection: AsyncIOMotorCollection, max_concurrency: int):
+        self.collection = collection
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def find_one(self, query: Dict[str, Any], projection: Dict[str, Any] = None):
+        async with self.semaphore:
+            return await self.collection.find_one(query, projection)
+
+    async def find(self, query: Dict[str, Any], projection: Dict[str, Any] = None, sort: List[Tuple[str, int]] = None, skip: int = 0, limit: int = 0):
+        async with self.semaphore:
+            cursor = self.collection.find(query, projection)
+            if sort:
+                cursor = cursor.sort(sort)
+            if skip:
+                cursor = cursor.skip(skip)
+            if limit:
+                cursor = cursor.limit(limit)
+            return await cursor.to_list(length=None)
+
+    # yields the results a batch at a time, the semaphore is only held while a batch is fetched
+    async def stream(self, query: Dict[str, Any], projection: Dict[str, Any] = None, batch_size: int = STREAM_BATCH_SIZE):
+        cursor = self.collection.find(query, projection, batch_size=batch_size)
+        try:
+            while True:
+                async with self.semaphore:
+                    batch = await cursor.to_list(length=batch_size)
+                if not batch:
+                    return
+                yield batch
+        finally:
+            await cursor.close()
+
+    async def distinct(self, key: str, query: Dict[str, Any] = None):
+        async with self.semaphore:
+            return await self.collection.distinct(key, query)
+
+    async def aggregate(self, pipeline: List[Dict[str, Any]]):
+        async with self.semaphore:
+            return await self.collection.aggregate(pipeline).to_list(length=None)
+
+    async def insert_one(self, document: Dict[str, Any]):
+        async with self.semaphore:
+            return await self.collection.insert_one(document)
+
+    # two upserts of a document that does not exist yet can both try to insert it. the unique index
+    # makes the loser fail with a DuplicateKeyError, and retrying it updates the winner's document
+    async def update_one(self, query: Dict[str, Any], update: Any, **kwargs):
+        async with self.semaphore:
+            try:
+                return await self.collection.update_one(query, update, **kwargs)
+            except DuplicateKeyError:
+                if not kwargs.get("upsert"):
+                    raise
+                return await self.collection.update_one(query, update, **kwargs)
+
+    async def find_one_and_update(self, query: Dict[str, Any], update: Any, **kwargs):
+        async with self.semaphore:
+            try:
+                return await self.collection.find_one_and_update(query, update, **kwargs)
+            except DuplicateKeyError:
+                if not kwargs.get("upsert"):
+                    raise
+                return await self.collection.find_one_and_update(query, update, **kwargs)
+
+    async def bulk_write(self, requests: List[Any], ordered: bool = True):
+        async with self.semaphore:
+            return await self.collection.bulk_write(requests, ordered=ordered)
+
+    async def delete_one(self, query: Dict[str, Any]):
+        async with self.semaphore:
+            return await self.collection.delete_one(query)
+
+class Repositories():
+    repositories: Dict[Tuple[str, str], Repository]
+
+    def __init__(self, clients: MongoClients, max_concurrency: int):
+        self.clients = clients
+        self.max_concurrency = max_concurrency
+        self.repositories = {}
+
+    def get(self, client: AsyncIOMotorClient, database: str, collection: str):
+        key = (database, collection)
+        if key not in self.repositories:
+            self.repositories[key] = Repository(client[database][collection], self.max_concurrency)
+        return self.repositories[key]
+
+    def meetupmaker(self, collection: str):
+        return self.get(self.clients.async_meetup, "meetupmaker", collection)
+
+    def quiz(self, quiz_type: str):
+        return self.get(self.clients.async_meetup, "quiz", quiz_type)
+
+    def place_names(self, collection: str):
+        return self.get(self.clients.async_cities, "place_names", collection)
@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List
+
+class Mailbox():
+    queue: asyncio.Queue
+    handler: Callable[[List[Dict[str, Any]]], Awaitable[None]]
+
+    # the room's only queue, with a single consumer, so a room handles one batch of messages at a time.
+    # everything waiting when the consumer comes back is handled together as the next batch
+    def __init__(self, name: str, max_size: int, max_batch: int, handler: Callable[[List[Dict[str, Any]]], Awaitable[None]]):
+        self.name = name
+        self.queue = asyncio.Queue(max_size)
+        self.max_batch = max_batch
+        self.handler = handler
+        self.received = 0
+        self.dropped = 0
+        self.stopped = False
+        self.processed = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.processing_time = 0
+        self.max_processing_time = 0
+        self.task = asyncio.create_task(self.consume())
+
+    # for messages of the server itself, which waits while the mailbox is full
+    async def put(self, message: Dict[str, Any]):
+        await self.queue.put(message)
+        self.received += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    # for messages from the bus, whose listener is shared by every room and cannot wait for this one,
+    # so a room that is max_size messages behind drops them
+    def offer(self, message: Dict[str, Any]):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            print(f"{self.name} is {self.queue.qsize()} messages behind, dropping message")
+            return
+        self.received += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    async def consume(self):
+        while not self.stopped:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            start = time.perf_counter()
+            try:
+                await self.handler(batch)
+            except Exception as e:
+                print(f"error handling messages for {self.name}: {e}")
+            elapsed = time.perf_counter() - start
+
+            self.processed += len(batch)
+            self.batches += 1
+            self.processing_time += elapsed
+            self.max_processing_time = max(self.max_processing_time, elapsed)
+
+    # messages still queued are dropped, unless the batch being handled is the one stopping it,
+    # which is left to finish
+    def stop(self):
+        self.stopped = True
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+    def get_stats(self):
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "received": self.received,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "batches": self.batches,
+            "avg_processing_ms": 1000 * self.processing_time / self.batches if self.batches else 0,
+            "max_processing_ms": 1000 * self.max_processing_time
+        }
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import resource
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+class Room():
+    kind: str
+    game: Any
+    on_evict: Callable[[], Awaitable[None]]
+    last_active: float
+
+    def __init__(self, kind: str, game: Any, on_evict: Callable[[], Awaitable[None]]):
+        self.kind = kind
+        self.game = game
+        self.on_evict = on_evict
+        self.last_active = time.monotonic()
+
+class RoomRegistry():
+    rooms: Dict[str, Room]
+
+    # every live game room of the process. a room is active while anyone is connected to it,
+    # and once it has been idle for idle_ttl seconds its on_evict drops it and tears it down
+    def __init__(self, idle_ttl: float, sweep_interval: float):
+        self.idle_ttl = idle_ttl
+        self.sweep_interval = sweep_interval
+        self.rooms = {}
+        self.evicted = 0
+        self.task = None
+
+    def register(self, kind: str, key: str, game: Any, on_evict: Callable[[], Awaitable[None]]):
+        self.rooms[f"{kind}:{key}"] = Room(kind, game, on_evict)
+
+    def touch(self, kind: str, key: str):
+        room = self.rooms.get(f"{kind}:{key}")
+        if room is not None:
+            room.last_active = time.monotonic()
+
+    async def evict(self, key: str):
+        room = self.rooms.pop(key, None)
+        if room is None:
+            return
+        try:
+            await room.on_evict()
+        except Exception as e:
+            print(f"failed to tear down room {key}: {e}")
+        self.evicted += 1
+
+    async def sweep(self):
+        now = time.monotonic()
+        idle = []
+        for key, room in self.rooms.items():
+            if room.game.has_connections():
+                room.last_active = now
+            elif now - room.last_active > self.idle_ttl:
+                idle.append(key)
+        for key in idle:
+            await self.evict(key)
+        if idle:
+            print(f"evicted {len(idle)} idle rooms, {len(self.rooms)} left")
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"room sweep failed: {e}")
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def get_stats(self):
+        by_kind = {}
+        mailboxes = {"depth": 0, "max_depth": 0, "processed": 0, "dropped": 0, "batches": 0, "max_processing_ms": 0}
+        for room in self.rooms.values():
+            by_kind[room.kind] = by_kind.get(room.kind, 0) + 1
+            mailbox = getattr(room.game, "mailbox", None)
+            if mailbox is not None:
+                stats = mailbox.get_stats()
+                for field in ("depth", "processed", "dropped", "batches"):
+                    mailboxes[field] += stats[field]
+                for field in ("max_depth", "max_processing_ms"):
+                    mailboxes[field] = max(mailboxes[field], stats[field])
+        return {
+            "rooms": len(self.rooms),
+            "rooms_by_kind": by_kind,
+            "mailboxes": mailboxes,
+            "evicted": self.evicted,
+            "memory_kb": get_memory_kb()
+        }
+
+# resident memory of the process, falling back to the peak where /proc is not available
+def get_memory_kb():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,126 @@
+from typing import Dict, Tuple
+import numpy as np
+
+# past this many cell lookups, measuring every point with numpy is faster than searching shells
+MAX_CELL_LOOKUPS = 1024
+
+class GridIndex():
+    cell_size: float
+    cells: Dict[Tuple[int, int], np.ndarray]
+
+    # uniform grid over lat/lng, each cell holds the indices of the points inside it
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, cell_size: float):
+        self.cell_size = cell_size
+        self.cells = {}
+        if len(lat) == 0:
+            return
+
+        rows = np.floor(lat / cell_size).astype(np.int64)
+        cols = np.floor(lng / cell_size).astype(np.int64)
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        boundaries = np.flatnonzero((np.diff(rows) != 0) | (np.diff(cols) != 0)) + 1
+        for indices, row, col in zip(np.split(order, boundaries), rows[np.r_[0, boundaries]], cols[np.r_[0, boundaries]]):
+            self.cells[(int(row), int(col))] = indices
+
+    # pairs of (query index, point index) for every point in a cell that could be within radius of the query,
+    # callers still need to check the exact distance
+    def candidates(self, lat: np.ndarray, lng: np.ndarray, radius: float):
+        reach = int(np.ceil(radius / self.cell_size))
+        rows = np.floor(lat / self.cell_size).astype(np.int64)
+        cols = np.floor(lng / self.cell_size).astype(np.int64)
+
+        queries = []
+        points = []
+        # queries in the same cell share the same neighbourhood
+        query_cells = {}
+        for query, cell in enumerate(zip(rows.tolist(), cols.tolist())):
+            if cell not in query_cells:
+                query_cells[cell] = []
+            query_cells[cell].append(query)
+
+        for (row, col), cell_queries in query_cells.items():
+            nearby = [
+                self.cells[(row + d_row, col + d_col)]
+                for d_row in range(-reach, reach + 1)
+                for d_col in range(-reach, reach + 1)
+                if (row + d_row, col + d_col) in self.cells
+            ]
+            if not nearby:
+                continue
+            nearby = np.concatenate(nearby)
+            queries.append(np.repeat(np.array(cell_queries, dtype=np.int64), len(nearby)))
+            points.append(np.tile(nearby, len(cell_queries)))
+
+        if not queries:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(queries), np.concatenate(points)
+
+def unit_vectors(lat: np.ndarray, lng: np.ndarray):
+    lat, lng = np.radians(lat), np.radians(lng)
+    return np.stack([np.cos(lat) * np.cos(lng), np.cos(lat) * np.sin(lng), np.sin(lat)], axis=-1)
+
+class SphereIndex():
+    cell_size: float
+    xyz: np.ndarray
+    cells: Dict[Tuple[int, int, int], np.ndarray]
+
+    # uniform grid over the points' unit vectors, so there are no poles or antimeridian to special case.
+    # straight line (chord) distance between unit vectors grows with the great circle distance,
+    # so the closest by chord are the closest on the sphere
+    def __init__(self, lat: np.ndarray, lng: np.ndarray, cell_size: float):
+        self.cell_size = cell_size
+        self.xyz = unit_vectors(lat.astype(np.float64), lng.astype(np.float64))
+        self.cells = {}
+        if len(self.xyz) == 0:
+            return
+
+        keys = np.floor(self.xyz / cell_size).astype(np.int64)
+        order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+        keys = keys[order]
+        boundaries = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        for indices, key in zip(np.split(order, boundaries), keys[np.r_[0, boundaries]].tolist()):
+            self.cells[tuple(key)] = indices
+
+    # indices of the k points closest to (lat, lng) and their chord distances, closest first.
+    # grows the searched block of cells one shell at a time until the k-th closest found is
+    # guaranteed to be closer than anything outside the block
+    def nearest(self, lat: float, lng: float, k: int):
+        query = unit_vectors(np.array(lat, dtype=np.float64), np.array(lng, dtype=np.float64))
+        center = np.floor(query / self.cell_size).astype(np.int64).tolist()
+        found = []
+        checked = 0
+        reach = 0
+        while True:
+            # once the shells would take more lookups than there are cells, or than measuring
+            # every point would cost, just measure every point
+            shell = (2 * reach + 1) ** 3 - max(2 * reach - 1, 0) ** 3
+            if checked + shell > min(len(self.cells), MAX_CELL_LOOKUPS):
+                candidates = None
+                break
+            checked += shell
+            for d_x in range(-reach, reach + 1):
+                for d_y in range(-reach, reach + 1):
+                    # inside the shell's x and y edges only its top and bottom faces are new
+                    on_edge = max(abs(d_x), abs(d_y)) == reach
+                    for d_z in (range(-reach, reach + 1) if on_edge else {-reach, reach}):
+                        cell = self.cells.get((center[0] + d_x, center[1] + d_y, center[2] + d_z))
+                        if cell is not None:
+                            found.append(cell)
+            if sum(len(cell) for cell in found) >= k:
+                candidates = np.concatenate(found)
+                distances = self.chords(self.xyz[candidates], query)
+                if np.partition(distances, k - 1)[k - 1] <= reach * self.cell_size:
+                    break
+            reach += 1
+
+        if candidates is None:
+            candidates = np.arange(len(self.xyz))
+            distances = self.chords(self.xyz, query)
+        best = np.argpartition(distances, k - 1)[:k] if len(distances) > k else np.arange(len(distances))
+        best = best[np.argsort(distances[best], kind="stable")]
+        return candidates[best], distances[best]
+
+    # |a - b| for unit vectors, from their dot product
+    def chords(self, xyz: np.ndarray, query: np.ndarray):
+        return np.sqrt(np.maximum(2 - 2 * (xyz @ query), 0))
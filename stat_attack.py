@@ -3,6 +3,7 @@ import numpy as np
 from typing import List, Dict, Any, Tuple
 from fastapi import WebSocket
 from fastapi.websockets import WebSocketDisconnect
+from room_registry import RoomRegistry
 
 CARDS_PER_PERSON = 20
 
@@ -63,6 +64,9 @@ class GameData():
         self.game_state = "lobby"
         self.is_higher = False
 
+    def has_connections(self):
+        return any(player.websocket is not None for player in [*self.players.values(), *self.spectators.values()])
+
     def get_player_card_counts(self):
         return {
             player_name: {
@@ -376,8 +380,9 @@ class StatAttackData():
     games_data: Dict[str, Dict[str, GameData]]
 
     # init
-    def __init__(self):
+    def __init__(self, room_registry: RoomRegistry):
         self.games_data = {}
+        self.room_registry = room_registry
 
     def game_data_exists(self, game_type: str, game_id: str):
         return game_type in self.games_data and game_id in self.games_data[game_type]
@@ -385,8 +390,14 @@ class StatAttackData():
     def get_game_data(self, game_type: str, game_id: str):
         if game_type not in self.games_data:
             self.games_data[game_type] = {}
-        
+
         if game_id not in self.games_data[game_type]:
             self.games_data[game_type][game_id] = GameData()
-        
-        return self.games_data[game_type][game_id]
\ No newline at end of file
+            self.room_registry.register("stat-attack", f"{game_type}-{game_id}", self.games_data[game_type][game_id],
+                                        lambda: self.remove_game_data(game_type, game_id))
+        self.room_registry.touch("stat-attack", f"{game_type}-{game_id}")
+
+        return self.games_data[game_type][game_id]
+
+    async def remove_game_data(self, game_type: str, game_id: str):
+        self.games_data.get(game_type, {}).pop(game_id, None)
@@ -0,0 +1,27 @@
+import json
+from typing import Any, AsyncIterator, Dict, List
+from fastapi.responses import StreamingResponse
+
+STREAM_FORMATS = ("ndjson", "array")
+
+async def ndjson_chunks(batches: AsyncIterator[List[Dict[str, Any]]]):
+    async for batch in batches:
+        yield "".join(json.dumps(document) + "\n" for document in batch).encode("utf-8")
+
+async def json_array_chunks(batches: AsyncIterator[List[Dict[str, Any]]]):
+    separator = "["
+    async for batch in batches:
+        if batch:
+            yield (separator + ",".join(json.dumps(document) for document in batch)).encode("utf-8")
+            separator = ","
+    yield b"[]" if separator == "[" else b"]"
+
+# writes each batch out as soon as it arrives instead of building the whole list first
+def stream_response(batches: AsyncIterator[List[Dict[str, Any]]], stream: str):
+    if stream == "ndjson":
+        return StreamingResponse(ndjson_chunks(batches), media_type="application/x-ndjson")
+    return StreamingResponse(json_array_chunks(batches), media_type="application/json")
+
+async def batched(documents: List[Dict[str, Any]], batch_size: int):
+    for start in range(0, len(documents), batch_size):
+        yield documents[start:start + batch_size]
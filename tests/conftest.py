@@ -0,0 +1,179 @@
+import asyncio
+import os
+import sys
+import mongomock
+import mongomock.aggregate
+import pytest
+from pymongo import ReturnDocument
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import indexes
+
+# mongomock does not know $sortArray (mongodb 5.2+), which the quiz leaderboard update uses,
+# and does not evaluate the expressions inside array literals given to $concatArrays
+handle_array_operator = mongomock.aggregate._Parser._handle_array_operator
+
+def handle_sort_array(parser, operator, value):
+    if operator == '$concatArrays' and isinstance(value, list):
+        value = [[parser.parse(element) for element in item] if isinstance(item, list) else item for item in value]
+    if operator != '$sortArray':
+        return handle_array_operator(parser, operator, value)
+    items = parser.parse(value['input'])
+    sort_by = value['sortBy']
+    if not isinstance(sort_by, dict):
+        return sorted(items, reverse=sort_by < 0)
+    for field, direction in reversed(list(sort_by.items())):
+        items = sorted(items, key=lambda item: item.get(field), reverse=direction < 0)
+    return items
+
+mongomock.aggregate._Parser._handle_array_operator = handle_sort_array
+
+# nor does it take a single expression for $max and $min, which mongodb applies to the array it resolves to
+handle_project_operator = mongomock.aggregate._Parser._handle_project_operator
+
+def handle_single_expression(parser, operator, values):
+    if operator in ('$max', '$min') and isinstance(values, dict):
+        resolved = parser.parse(values)
+        values = [{ '$literal': value } for value in (resolved if isinstance(resolved, list) else [resolved])]
+    return handle_project_operator(parser, operator, values)
+
+mongomock.aggregate._Parser._handle_project_operator = handle_single_expression
+if '$sortArray' not in mongomock.aggregate.array_operators:
+    mongomock.aggregate.array_operators.append('$sortArray')
+
+# nor arrayFilters, nor $addToSet and $pull through array indices, so updates with arrayFilters are
+# applied to the document here. only $set, $addToSet and $pull, and equality filters on the element's fields
+def get_path(document, path):
+    for key in path.split('.'):
+        document = document.get(key) if isinstance(document, dict) else None
+    return document
+
+def apply_array_filters(document, update, array_filters):
+    conditions = {}
+    for array_filter in array_filters:
+        for key, value in array_filter.items():
+            name, field = key.split('.', 1)
+            conditions.setdefault(name, {})[field] = value
+
+    for operator, fields in update.items():
+        for path, value in fields.items():
+            prefix, rest = path.split('.$[', 1)
+            name, suffix = rest.split(']', 1)
+            for element in get_path(document, prefix) or []:
+                if not all(get_path(element, field) == expected for field, expected in conditions[name].items()):
+                    continue
+                *parents, key = suffix.lstrip('.').split('.')
+                target = element
+                for parent in parents:
+                    target = target.setdefault(parent, {})
+                if operator == '$set':
+                    target[key] = value
+                elif operator == '$addToSet':
+                    if value not in target.setdefault(key, []):
+                        target[key].append(value)
+                elif operator == '$pull':
+                    target[key] = [item for item in target.get(key, []) if item != value]
+                else:
+                    raise NotImplementedError(operator)
+
+class FakeCursor():
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def sort(self, *args):
+        self.cursor = self.cursor.sort(*args)
+        return self
+
+    def skip(self, count):
+        self.cursor = self.cursor.skip(count)
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.cursor)
+
+class FakeMotorCollection():
+    # motor-like collection over mongomock. every call is atomic, like a single document write on mongod,
+    # except that an upsert matches and inserts in two steps with other requests able to run in between,
+    # which is how two upserts of the same new document can both insert it. every call also yields first,
+    # like a round trip would, so requests that take several calls interleave
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+        self.scratch = mongomock.MongoClient().scratch[collection.name]
+
+    async def find_one(self, query, projection=None):
+        await asyncio.sleep(0)
+        return self.collection.find_one(query, projection)
+
+    def find(self, query, projection=None, **kwargs):
+        return FakeCursor(self.collection.find(query, projection))
+
+    def aggregate(self, pipeline):
+        return FakeCursor(self.collection.aggregate(pipeline))
+
+    async def insert_one(self, document):
+        await asyncio.sleep(0)
+        return self.collection.insert_one(document)
+
+    async def upsert(self, method, query, update, kwargs):
+        if self.collection.find_one(query, { '_id': True }) is not None:
+            return getattr(self.collection, method)(query, update, **kwargs)
+        await asyncio.sleep(0)
+        self.scratch.delete_many({})
+        result = getattr(self.scratch, method)(query, update, upsert=True)
+        document = self.scratch.find_one({})
+        self.collection.insert_one(document)
+        if method == 'find_one_and_update':
+            if kwargs.get('return_document') != ReturnDocument.AFTER:
+                return None
+            return self.collection.find_one({ '_id': document['_id'] }, kwargs.get('projection'))
+        return result
+
+    async def update_one(self, query, update, **kwargs):
+        await asyncio.sleep(0)
+        if kwargs.get('upsert'):
+            return await self.upsert('update_one', query, update, kwargs)
+        return self.collection.update_one(query, update, **kwargs)
+
+    async def find_one_and_update(self, query, update, **kwargs):
+        await asyncio.sleep(0)
+        if kwargs.get('upsert'):
+            return await self.upsert('find_one_and_update', query, update, kwargs)
+        if 'array_filters' in kwargs:
+            document = self.collection.find_one(query)
+            if document is None:
+                return None
+            before = self.collection.find_one({ '_id': document['_id'] }, kwargs.get('projection'))
+            apply_array_filters(document, update, kwargs['array_filters'])
+            self.collection.replace_one({ '_id': document['_id'] }, document)
+            if kwargs.get('return_document') != ReturnDocument.AFTER:
+                return before
+            return self.collection.find_one({ '_id': document['_id'] }, kwargs.get('projection'))
+        return self.collection.find_one_and_update(query, update, **kwargs)
+
+    async def bulk_write(self, requests, ordered=True):
+        await asyncio.sleep(0)
+        return self.collection.bulk_write(requests, ordered=ordered)
+
+    async def create_index(self, keys, **kwargs):
+        return self.collection.create_index(keys, **kwargs)
+
+class FakeDatabase():
+    def __init__(self):
+        self.database = mongomock.MongoClient().db
+        self.collections = {}
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeMotorCollection(self.database[name])
+        return self.collections[name]
+
+@pytest.fixture
+def database():
+    indexes.indexed_quiz_types.clear()
+    return FakeDatabase()
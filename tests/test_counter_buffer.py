@@ -0,0 +1,62 @@
+import asyncio
+from pymongo.errors import BulkWriteError
+from counter_buffer import CounterBuffer
+
+class FakeRepository():
+    # adds up the $inc of every update, except that updates for failing ids report a write error
+    # the way an unordered bulk write does, while the rest go through
+    def __init__(self, failing_ids=()):
+        self.totals = {}
+        self.failing_ids = set(failing_ids)
+        self.writing = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def bulk_write(self, requests, ordered=True):
+        self.writing.set()
+        await self.release.wait()
+        errors = []
+        for index, request in enumerate(requests):
+            document_id = request._filter["_id"]
+            if document_id in self.failing_ids:
+                errors.append({ "index": index, "code": 11000, "errmsg": "duplicate key" })
+                continue
+            for field, delta in request._doc["$inc"].items():
+                self.totals[(document_id, field)] = self.totals.get((document_id, field), 0) + delta
+        if errors:
+            raise BulkWriteError({ "writeErrors": errors, "nInserted": 0, "nUpserted": 0, "nMatched": len(requests) - len(errors) })
+
+def test_partially_failed_flush_only_retries_the_failed_updates():
+    async def flush_twice():
+        repository = FakeRepository(failing_ids=[2])
+        buffer = CounterBuffer(60)
+        for document_id in (1, 2, 3):
+            buffer.increment(repository, { "_id": document_id }, "likes")
+        await buffer.flush()
+        assert repository.totals == { (1, "likes"): 1, (3, "likes"): 1 }
+        assert buffer.get_pending(repository, { "_id": 2 }, "likes") == 1
+        assert buffer.get_pending(repository, { "_id": 1 }, "likes") == 0
+
+        repository.failing_ids.clear()
+        await buffer.flush()
+        return repository.totals
+
+    assert asyncio.run(flush_twice()) == { (1, "likes"): 1, (2, "likes"): 1, (3, "likes"): 1 }
+
+def test_stop_writes_increments_made_during_the_last_flush():
+    async def stop_during_flush():
+        repository = FakeRepository()
+        repository.release.clear()
+        buffer = CounterBuffer(0.01)
+        buffer.start()
+        buffer.increment(repository, { "_id": 1 }, "likes")
+        await repository.writing.wait()
+
+        buffer.increment(repository, { "_id": 1 }, "likes")
+        stopping = asyncio.create_task(buffer.stop())
+        await asyncio.sleep(0)
+        repository.release.set()
+        await stopping
+        return repository.totals
+
+    assert asyncio.run(stop_during_flush()) == { (1, "likes"): 2 }
@@ -0,0 +1,23 @@
+import asyncio
+from country_bounds import CountryBounds
+from repositories import Repository
+
+CITIES = [
+    { "name": "Singapore", "code": "SG", "lat": 1.29, "lng": 103.85 },
+    { "name": "Woodlands", "code": "SG", "lat": 1.44, "lng": 103.79 },
+    { "name": "Johor Bahru", "code": "MY", "lat": 1.49, "lng": 103.74 },
+]
+
+def test_missing_table_falls_back_to_the_cities(database):
+    cities = database.collection("cities")
+    cities.collection.insert_many([dict(city) for city in CITIES])
+
+    async def fetch():
+        country_bounds = CountryBounds(Repository(cities, 10))
+        await country_bounds.load(Repository(database.collection("country_bounds"), 10))
+        return await country_bounds.fetch("SG"), await country_bounds.fetch("XX"), country_bounds.get("sg")
+
+    bounds, missing, cached = asyncio.run(fetch())
+    assert bounds == { "minLat": 1.29, "maxLat": 1.44, "minLng": 103.79, "maxLng": 103.85 }
+    assert missing is None
+    assert cached == bounds
@@ -0,0 +1,39 @@
+import asyncio
+from gazetteer import Gazetteer, city_query
+from repositories import Repository
+
+CITIES = [
+    { "name": "Singapore", "code": "SG", "code_lower": "sg", "name_lower": "singapore", "lat": 1.29, "lng": 103.85, "population": 5000000 },
+    { "name": "Woodlands", "code": "SG", "code_lower": "sg", "name_lower": "woodlands", "lat": 1.44, "lng": 103.79, "population": 250000 },
+]
+
+def test_unknown_codes_do_not_push_out_real_countries(database):
+    cities = database.collection("cities")
+    cities.collection.insert_many([dict(city) for city in CITIES])
+    gazetteer = Gazetteer(Repository(cities, 10), 2)
+
+    async def suggest():
+        await gazetteer.suggest("SG", "wo", 5)
+        junk = [await gazetteer.suggest(f"X{index}", "wo", 5) for index in range(10)]
+        return junk, await gazetteer.suggest("SG", "wo", 5)
+
+    junk, suggestions = asyncio.run(suggest())
+    assert all(result == [] for result in junk)
+    assert [city["name"] for city in suggestions] == ["Woodlands"]
+    assert list(gazetteer.countries) == ["sg"]
+
+def test_cities_without_keys_are_still_found(database):
+    cities = database.collection("cities")
+    # imported before backfill-city-keys, one of them already backfilled
+    cities.collection.insert_many([{ key: value for key, value in city.items() if not key.endswith("_lower") } for city in CITIES])
+    cities.collection.insert_one({ "name": "Jurong", "code": "SG", "code_lower": "sg", "name_lower": "jurong", "lat": 1.33, "lng": 103.74 })
+    repository = Repository(cities, 10)
+
+    async def look_up():
+        found = await repository.find(city_query(" sg", "WOODLANDS"), { "_id": False, "name": True })
+        suggestions = await Gazetteer(repository, 2).suggest("sg", "", 5)
+        return found, suggestions
+
+    found, suggestions = asyncio.run(look_up())
+    assert found == [{ "name": "Woodlands" }]
+    assert [city["name"] for city in suggestions] == ["Singapore", "Woodlands", "Jurong"]
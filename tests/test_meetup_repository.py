@@ -0,0 +1,112 @@
+import asyncio
+from meetup_repository import MeetupRepository
+from repositories import Repository
+
+LIKERS = 50
+
+def insert_meetup(meetups):
+    return str(meetups.collection.insert_one({
+        "participants": {},
+        "preferences": {},
+        "recommendations": [
+            { "timing": "10:00", "location": "Jewel", "score": 3.0, "likes": [] },
+            { "timing": "10:15", "location": "Jewel", "score": 2.0, "likes": [] },
+            { "timing": "10:00", "location": "VivoCity", "score": 1.0, "likes": ["carol"] },
+        ]
+    }).inserted_id)
+
+def get_likes(meetups, timing, location):
+    meetup = meetups.collection.find_one({})
+    return next(rec["likes"] for rec in meetup["recommendations"] if rec["timing"] == timing and rec["location"] == location)
+
+def test_simultaneous_likes_are_all_kept(database):
+    meetups = database.collection("meetup")
+    meetup_id = insert_meetup(meetups)
+    names = [f"friend {index}" for index in range(LIKERS)]
+
+    async def like_all():
+        repository = MeetupRepository(Repository(meetups, LIKERS))
+        return await asyncio.gather(*(repository.toggle_like(meetup_id, name, "10:00", "Jewel") for name in names))
+
+    results = asyncio.run(like_all())
+    assert all(result is not None for result in results)
+    assert sorted(get_likes(meetups, "10:00", "Jewel")) == sorted(names)
+    # the other recommendations are left alone
+    assert get_likes(meetups, "10:15", "Jewel") == []
+    assert get_likes(meetups, "10:00", "VivoCity") == ["carol"]
+
+def test_liking_again_unlikes(database):
+    meetups = database.collection("meetup")
+    meetup_id = insert_meetup(meetups)
+
+    async def toggle():
+        repository = MeetupRepository(Repository(meetups, 10))
+        await repository.toggle_like(meetup_id, "alice", "10:00", "VivoCity")
+        liked = get_likes(meetups, "10:00", "VivoCity")
+        await repository.toggle_like(meetup_id, "carol", "10:00", "VivoCity")
+        await repository.toggle_like(meetup_id, "alice", "10:00", "VivoCity")
+        return liked
+
+    assert asyncio.run(toggle()) == ["carol", "alice"]
+    assert get_likes(meetups, "10:00", "VivoCity") == []
+
+def test_liking_a_missing_meetup_returns_none(database):
+    meetups = database.collection("meetup")
+    insert_meetup(meetups)
+
+    async def like_missing():
+        return await MeetupRepository(Repository(meetups, 10)).toggle_like("0" * 24, "alice", "10:00", "Jewel")
+
+    assert asyncio.run(like_missing()) is None
+
+class CountingCollection():
+    # counts the calls made to the collection, each of which is a round trip to mongod
+    def __init__(self, collection):
+        self.collection = collection
+        self.calls = {}
+
+    def __getattr__(self, name):
+        method = getattr(self.collection, name)
+        def call(*args, **kwargs):
+            self.calls[name] = self.calls.get(name, 0) + 1
+            return method(*args, **kwargs)
+        return call
+
+def test_round_trips_per_endpoint(database):
+    meetups = database.collection("meetup")
+    meetup_id = insert_meetup(meetups)
+    missing_id = "0" * 24
+    preference = { "start_time": "09:00", "end_time": "12:00", "start_lat": 1.3, "start_lng": 103.8, "end_lat": 1.3, "end_lng": 103.8 }
+    location = { "name": "Jewel", "lat": 1.36, "lng": 103.99 }
+    # the repository call behind each endpoint, and the round trips it may take
+    endpoints = {
+        "join_meetup": (lambda repository, meetup_id: repository.set_participant(meetup_id, "alice", ["2024-06-01"]), 1),
+        "confirm_meetup": (lambda repository, meetup_id: repository.set_date(meetup_id, "2024-06-01"), 1),
+        "add_preferences": (lambda repository, meetup_id: repository.set_preference(meetup_id, "alice", preference), 1),
+        # a like first tries to remove an existing one
+        "like": (lambda repository, meetup_id: repository.toggle_like(meetup_id, "alice", "10:00", "Jewel"), 2),
+        "unlike": (lambda repository, meetup_id: repository.toggle_like(meetup_id, "alice", "10:00", "Jewel"), 1),
+        "confirm_timing": (lambda repository, meetup_id: repository.set_timing(meetup_id, "10:00", location), 1),
+    }
+
+    async def count(call, meetup_id):
+        collection = CountingCollection(meetups)
+        result = await call(MeetupRepository(Repository(collection, 10)), meetup_id)
+        return result, collection.calls
+
+    for endpoint, (call, round_trips) in endpoints.items():
+        result, calls = asyncio.run(count(call, meetup_id))
+        assert result is not None, endpoint
+        assert calls == { "find_one_and_update": round_trips }, endpoint
+        # a meetup that does not exist is told apart by the result, not by another read
+        if endpoint != "unlike":
+            result, calls = asyncio.run(count(call, missing_id))
+            assert result is None, endpoint
+            assert calls == { "find_one_and_update": round_trips }, endpoint
+
+    meetup = meetups.collection.find_one({})
+    assert meetup["participants"] == { "alice": ["2024-06-01"] }
+    assert meetup["date"] == "2024-06-01"
+    assert meetup["preferences"] == { "alice": preference }
+    assert meetup["timing"] == "10:00" and meetup["location"] == location
+    assert get_likes(meetups, "10:00", "Jewel") == []
@@ -0,0 +1,104 @@
+import asyncio
+import time
+import message_bus
+from message_bus import HybridBus
+from redis_client import Subscription
+
+class FakeRedis():
+    # the sorted set commands the presence sets use, over plain dicts
+    def __init__(self):
+        self.sorted_sets = {}
+        self.expiries = {}
+
+    async def zadd(self, key, mapping):
+        self.sorted_sets.setdefault(key, {}).update({ member.encode("utf-8"): score for member, score in mapping.items() })
+
+    async def zrem(self, key, member):
+        self.sorted_sets.get(key, {}).pop(member.encode("utf-8"), None)
+
+    async def zrangebyscore(self, key, low, high):
+        high = float(high)
+        return [member for member, score in self.sorted_sets.get(key, {}).items() if low <= score <= high]
+
+    async def zremrangebyscore(self, key, low, high):
+        low = float(low)
+        members = self.sorted_sets.get(key, {})
+        for member in [member for member, score in members.items() if low <= score <= high]:
+            members.pop(member)
+
+    async def expire(self, key, seconds):
+        self.expiries[key] = seconds
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline():
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append(getattr(self.redis, name)(*args))
+
+    async def execute(self):
+        return [await command for command in self.commands]
+
+class FakeRedisClient():
+    # pubsub shared by every worker's client, messages are handed to the receivers on the next loop turn
+    def __init__(self, redis, receivers):
+        self.client = redis
+        self.receivers = receivers
+        self.subscriptions = {}
+
+    async def publish(self, channel, message):
+        for receiver in list(self.receivers.get(channel, ())):
+            asyncio.get_running_loop().call_soon(receiver.offer, message)
+
+    async def subscribe(self, channel, callback):
+        await self.attach(channel, Subscription(channel, callback))
+
+    async def attach(self, channel, receiver):
+        self.subscriptions[channel] = receiver
+        self.receivers.setdefault(channel, []).append(receiver)
+
+    async def unsubscribe(self, channel):
+        receiver = self.subscriptions.pop(channel)
+        self.receivers[channel].remove(receiver)
+        receiver.stop()
+
+def test_worker_that_died_without_leaving_is_forgotten(monkeypatch):
+    redis, receivers = FakeRedis(), {}
+
+    async def handle(data):
+        pass
+
+    async def crash():
+        alive = HybridBus(FakeRedisClient(redis, receivers))
+        crashed = HybridBus(FakeRedisClient(redis, receivers))
+        await alive.subscribe("room", handle)
+        await crashed.subscribe("room", handle)
+        # lets the join announcement through
+        await asyncio.sleep(0.01)
+        shared = not alive.is_local("room")
+
+        # the crashed worker stops its heartbeat without leaving the room, and PRESENCE_TTL passes
+        crashed.heartbeat_task.cancel()
+        now = time.time()
+        monkeypatch.setattr(message_bus.time, "time", lambda: now + message_bus.PRESENCE_TTL + 1)
+        await alive.refresh_presence()
+        alive.heartbeat_task.cancel()
+        return shared, alive, crashed
+
+    shared, alive, crashed = asyncio.run(crash())
+    assert shared
+    assert alive.remote_workers["room"] == set()
+    assert alive.is_local("room")
+    key = alive.get_presence_key("room")
+    assert list(redis.sorted_sets[key]) == [alive.worker_id.encode("utf-8")]
+    assert redis.expiries[key] == message_bus.PRESENCE_TTL
@@ -0,0 +1,50 @@
+import asyncio
+import random
+from quiz_repository import QuizRepository, QUIZ_LEADERBOARD_SIZE
+from repositories import Repository
+
+# mongomock has no $sortArray, and conftest implements it and single-expression $max itself, so these
+# tests check the update against that shim rather than against mongodb. the concurrency they check,
+# one document per quiz_name under the unique index, does not depend on the shim
+SUBMISSIONS = 1000
+PLAYERS = 40
+
+def test_concurrent_first_submissions_share_one_leaderboard(database):
+    quizzes = database.collection("countries")
+    scores = random.Random(0).sample(range(100000), SUBMISSIONS)
+    submissions = [(f"player{index % PLAYERS}", score) for index, score in enumerate(scores)]
+
+    async def submit_all():
+        repository = QuizRepository(Repository(quizzes, 50))
+        return await asyncio.gather(*(repository.submit_score("europe", name, score) for name, score in submissions))
+
+    results = asyncio.run(submit_all())
+
+    documents = list(quizzes.collection.find({ "quiz_name": "europe" }))
+    assert len(documents) == 1
+    assert documents[0]["plays"] == SUBMISSIONS
+
+    best = {}
+    for name, score in submissions:
+        best[name] = max(score, best.get(name, 0))
+    expected = sorted(({ "name": name, "score": score } for name, score in best.items()), key=lambda player: -player["score"])
+    assert documents[0]["players"] == expected[:QUIZ_LEADERBOARD_SIZE]
+    assert sorted(result["plays"] for result in results) == list(range(1, SUBMISSIONS + 1))
+
+def test_new_quiz_type_gets_a_unique_index(database):
+    quizzes = database.collection("flags")
+    asyncio.run(QuizRepository(Repository(quizzes, 10)).get("asia"))
+
+    unique = [index["key"] for index in quizzes.collection.index_information().values() if index.get("unique")]
+    assert unique == [[("quiz_name", 1)]]
+
+def test_concurrent_first_reads_create_one_quiz(database):
+    quizzes = database.collection("capitals")
+
+    async def read_all():
+        repository = QuizRepository(Repository(quizzes, 10))
+        return await asyncio.gather(*(repository.get("africa") for _ in range(20)))
+
+    results = asyncio.run(read_all())
+    assert quizzes.collection.count_documents({ "quiz_name": "africa" }) == 1
+    assert all(result == { "quiz_name": "africa", "players": [], "plays": 0 } for result in results)
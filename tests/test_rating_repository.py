@@ -0,0 +1,75 @@
+import asyncio
+import random
+import pymongo
+import pytest
+from indexes import MEETUPMAKER_INDEXES, create_indexes
+from pagination import decode_cursor
+from rating_repository import RatingRepository
+from repositories import Repository
+
+RATINGS = 500
+FIELDS = ["taste", "price"]
+
+def test_concurrent_first_ratings_share_one_item(database):
+    ratings = database.collection("ratings")
+    generator = random.Random(0)
+    submitted = [{ field: generator.randint(1, 5) for field in FIELDS } for _ in range(RATINGS)]
+
+    async def rate_all():
+        await create_indexes(ratings, MEETUPMAKER_INDEXES["ratings"])
+        repository = RatingRepository(Repository(ratings, 50))
+        await asyncio.gather(*(repository.rate("food", "Joe's Pizza", FIELDS, data, 1) for data in submitted))
+
+    asyncio.run(rate_all())
+
+    documents = list(ratings.collection.find({ "category": "food", "item": "Joe's Pizza" }))
+    assert len(documents) == 1
+    rating = documents[0]
+    assert rating["count"] == RATINGS
+    assert rating["item_lower"] == "joe's pizza"
+    for field in FIELDS:
+        total = sum(data[field] for data in submitted)
+        assert rating["sums"][field] == total
+        assert rating[field] == pytest.approx(total / RATINGS)
+
+def test_edits_swap_the_old_rating(database):
+    ratings = database.collection("ratings")
+
+    async def rate_and_edit():
+        repository = RatingRepository(Repository(ratings, 10))
+        await repository.rate("food", "Soup", FIELDS, { "taste": 4, "price": 2 }, 1)
+        await repository.rate("food", "Soup", FIELDS, { "taste": 2, "price": 4 }, 1)
+        await repository.rate("food", "Soup", FIELDS, { "taste": -3, "price": 1 }, 0)
+
+    asyncio.run(rate_and_edit())
+
+    rating = ratings.collection.find_one({ "item": "Soup" })
+    assert rating["count"] == 2
+    assert rating["sums"] == { "taste": 3, "price": 7 }
+    assert rating["taste"] == pytest.approx(1.5)
+    assert rating["price"] == pytest.approx(3.5)
+
+def test_pages_by_a_dotted_field_visit_every_item_once(database):
+    ratings = database.collection("ratings")
+    # repeated values and an item that was never rated on taste
+    ratings.collection.insert_many([{ "category": "food", "item": f"Item {index}", "sums": { "taste": index % 7 } } for index in range(24)])
+    ratings.collection.insert_one({ "category": "food", "item": "Unrated", "sums": {} })
+
+    async def read_all(sort_order):
+        repository = RatingRepository(Repository(ratings, 10))
+        items, after = [], None
+        # a cursor that does not move would serve the same page forever
+        for _ in range(5):
+            page, next_cursor = await repository.page({ "category": "food" }, "sums.taste", sort_order, 10, after)
+            items.extend(page)
+            if next_cursor is None:
+                break
+            after = decode_cursor(next_cursor)
+        return items
+
+    for sort_order in (pymongo.ASCENDING, pymongo.DESCENDING):
+        items = asyncio.run(read_all(sort_order))
+        assert len(items) == 25
+        assert len({ item["_id"] for item in items }) == 25
+        tastes = [item["sums"].get("taste", -1) for item in items]
+        assert tastes == sorted(tastes, reverse=sort_order == pymongo.DESCENDING)
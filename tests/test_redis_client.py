@@ -0,0 +1,50 @@
+import asyncio
+import redis.asyncio as redis
+import redis_client
+from redis_client import RedisClient
+
+class FakePubSub():
+    # pubsub that is down until `up` is set, a subscribe then connects it like redis-py does
+    def __init__(self, server):
+        self.server = server
+        self.connection = None
+        self.channels = {}
+
+    async def subscribe(self, *channels):
+        if not self.server["up"]:
+            raise redis.ConnectionError("Connection refused")
+        self.connection = object()
+        self.channels.update(dict.fromkeys(channels))
+
+    async def unsubscribe(self, *channels):
+        for channel in channels:
+            self.channels.pop(channel, None)
+
+    async def get_message(self, ignore_subscribe_messages=False, timeout=None):
+        await asyncio.sleep(0.01)
+        return None
+
+    async def aclose(self):
+        self.connection = None
+
+def test_channel_subscribed_while_redis_was_down_is_subscribed_once_it_is_back(monkeypatch):
+    monkeypatch.setattr(redis_client, "RECONNECT_DELAY", 0.01)
+    server = { "up": False }
+
+    async def handle(data):
+        pass
+
+    async def subscribe():
+        client = RedisClient("localhost", None, 6379)
+        client.client.pubsub = lambda: FakePubSub(server)
+        client.pubsub = client.client.pubsub()
+        await client.subscribe("room-a", handle)
+        await asyncio.sleep(0.05)
+        server["up"] = True
+        await client.subscribe("room-b", handle)
+        await asyncio.sleep(0.05)
+        channels = set(client.pubsub.channels)
+        client.listener.cancel()
+        return channels
+
+    assert asyncio.run(subscribe()) == { "room-a", "room-b" }
@@ -0,0 +1,31 @@
+import asyncio
+from message_bus import LocalBus
+from room_mailbox import Mailbox
+
+def test_bus_delivers_into_the_mailbox_and_counts_what_it_drops():
+    async def flood():
+        handled = []
+        release = asyncio.Event()
+
+        async def handle(batch):
+            handled.extend(batch)
+            await release.wait()
+
+        bus = LocalBus()
+        mailbox = Mailbox("room", 8, 4, handle)
+        await bus.attach("room", mailbox)
+        await bus.publish("room", { "method": "play", "index": 0 })
+        await asyncio.sleep(0)
+        # the first message is being handled, 8 more fit in the mailbox
+        for index in range(1, 20):
+            await bus.publish("room", { "method": "play", "index": index })
+        stats = mailbox.get_stats()
+        release.set()
+        await asyncio.sleep(0.01)
+        await bus.close()
+        return handled, stats
+
+    handled, stats = asyncio.run(flood())
+    assert [data["index"] for data in handled] == list(range(9))
+    assert stats["dropped"] == 11
+    assert stats["received"] == 9